@@ -19,30 +19,249 @@ Ovsdb Manager main class.
      Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
 """
 import socket
-from typing import Dict
+import threading
+from typing import Callable, Dict, List, Tuple
 
 from ovsdbmanager import operation
+from ovsdbmanager.cluster import OvsdbCluster
+from ovsdbmanager.coalescer import CoalescingWriter, MAX_BATCH
 from ovsdbmanager.condition import get_by_uuid, get_by_name
 from ovsdbmanager.exception import OvsdbQueryException, OvsdbResourceNotFoundException
-from ovsdbmanager.query import OvsdbQuery
+from ovsdbmanager.connection import OvsdbConnection
+from ovsdbmanager.feed import ChangeFeed, Subscription, monitored_columns
+from ovsdbmanager.lock import OvsdbLock
+from ovsdbmanager.pool import OvsdbConnectionPool
+from ovsdbmanager.query import OvsdbQuery, BACKOFF_BASE, BACKOFF_MAX, MAX_RETRIES
+from ovsdbmanager.replica import OvsdbReplica
+from ovsdbmanager.topology import Topology
 from ovsdbmanager.db.bridge import OvsBridge
 from ovsdbmanager.db.controller import OvsController
 from ovsdbmanager.db.interface import OvsInterface
 from ovsdbmanager.db.ovs import OpenVSwitch
 from ovsdbmanager.db.port import OvsPort
-from ovsdbmanager.utils import generate_uuid, named_uuid
+from ovsdbmanager.utils import generate_uuid, named_uuid, parse_set, jittered_backoff
 
 
 class OvsdbManager:
-    def __init__(self, ip: str = "127.0.0.1", port: int = 6640, db: str = "Open_vSwitch"):
-        self.query = OvsdbQuery(ip, port, db)
+    def __init__(self, ip: str = "127.0.0.1", port: int = 6640, db: str = "Open_vSwitch",
+                 coalesce_window: float = None, coalesce_batch: int = MAX_BATCH,
+                 pool: OvsdbConnectionPool = None, record: str = None,
+                 remotes: List[Tuple[str, int]] = None, validate: bool = False):
+        """
+        :param ip: the address of the server
+        :param port: the port of the server
+        :param db: the database
+        :param coalesce_window: if present, seconds during which the row
+        updates done by different threads are merged in one transaction
+        :param coalesce_batch: maximum number of merged operations
+        :param pool: pool of persistent connections to use
+        :param record: path of a file where all the traffic is logged
+        :param remotes: list of (ip, port) of the members of a clustered
+        database. If present, 'ip', 'port' and 'pool' are ignored
+        :param validate: check the operations against the schema of the
+        database before sending them
+        """
+        self.cluster = None
+        if remotes:
+            self.cluster = OvsdbCluster(remotes, db)
+            ip, port = self.cluster.remotes[0]
+            pool = None
+        if pool is not None:
+            ip, port = pool.ip, pool.port
+        self.query = OvsdbQuery(ip, port, db, pool, record, cluster=self.cluster,
+                                validate=validate)
         self.db = db
+        self.writer = None
+        self.replica = None
+        self.feed = None
+        self.locks = []
+        self._closed = threading.Event()
+        self._reconnecting = set()
+        self._reconnect_lock = threading.Lock()
+        if coalesce_window is not None:
+            self.writer = CoalescingWriter(self.query, coalesce_window, coalesce_batch)
         try:
             self.query.echo_request()
         except socket.timeout:
             raise OvsdbQueryException("Connection timed out")
 
-    def get_table_raw(self, table: str) -> Dict:
+    def update_row(self, table: str, uuid, row: Dict):
+        """
+        Updates some columns of a row. If the manager has been created with
+        a coalescing window, the update is merged with the ones done by
+        other threads in the same window.
+        :param table: the table of the row
+        :param uuid: the uuid of the row
+        :param row: the columns to update
+        :return:
+        """
+        op = operation.update(table, row=row, where=[get_by_uuid(uuid)])
+        return self._write([op])[0]
+
+    def update_keys(self, table: str, column: str, rows) -> List[Dict]:
+        """
+        Sets or deletes keys of a map column (e.g. external_ids) in many
+        rows at once. Only the given keys are sent, using mutate
+        operations, and all the rows are changed in one transaction.
+        :param table: the table of the rows
+        :param column: the map column
+        :param rows: list of (uuid, keys) pairs, or dict of keys by uuid,
+        with the keys to set and their values. The keys whose value is
+        None are deleted. The uuids are given as in the rows (["uuid",
+        ...]) or, in dicts, as bare strings
+        :return: the result of the operation of each row
+        """
+        if isinstance(rows, dict):
+            rows = rows.items()
+        ops = [operation.update_keys(table, column, keys, where=[get_by_uuid(
+            uuid if isinstance(uuid, list) else ["uuid", uuid])]) for uuid, keys in rows]
+        if not ops:
+            return []
+        return self._write(ops)
+
+    def _write(self, ops: List[Dict]) -> List:
+        # Single operations go through the coalescing writer, if any, so
+        # that they can be merged with the ones of other threads
+        if self.writer and len(ops) == 1:
+            return [self.writer.submit(ops[0]).result()]
+        return self.query.multiple_ops(ops)["result"]
+
+    def replicate(self, tables: Dict[str, List] = None, snapshot: str = None) -> OvsdbReplica:
+        """
+        Keeps a local copy of some tables, which is then used by
+        get_table_raw instead of querying the server.
+        :param tables: the tables to replicate, with the list of columns of
+        each one (None for all of them)
+        :param snapshot: path of a snapshot file saved with
+        OvsdbReplica.save_snapshot. If present, only the changes done since
+        it was saved are requested to the server
+        :return: OvsdbReplica
+        """
+        connection = self._connect(write=False)
+        self.replica = OvsdbReplica(connection, self.db, tables, snapshot)
+        connection.add_close_handler(self._resume_replica)
+        return self.replica
+
+    def subscribe(self, table: str, callback: Callable = None, columns: List[str] = None,
+                  where: List = None, initial: bool = False) -> Subscription:
+        """
+        Subscribes to the inserts, modifications and deletes of the rows
+        of a table. All the subscriptions share the replica (see
+        replicate), which is started if needed and only monitors the
+        columns the subscriptions use.
+        :param table: the table
+        :param callback: function that receives each RowEvent. If not
+        present, the subscription is iterated with 'async for'
+        :param columns: the columns of interest (None for all of them)
+        :param where: the conditions the rows have to match, as used in
+        operation.select
+        :param initial: deliver the rows currently matching the
+        conditions as inserts before any change
+        :return: Subscription, which has to be closed when no longer needed
+        """
+        if self.replica is None:
+            self.replicate({table: monitored_columns(columns, where)})
+        if self.feed is None:
+            self.feed = ChangeFeed(self.replica)
+        return self.feed.subscribe(table, callback, columns, where, initial)
+
+    def lock(self, name: str, on_acquired: Callable = None,
+             on_lost: Callable = None) -> OvsdbLock:
+        """
+        Creates a lock to coordinate several managers writing to the same
+        database. Locks belong to a session, so from now on the manager
+        sends all its requests through a dedicated connection, and all its
+        write transactions fail with OvsdbNotOwner unless it holds the lock.
+        If the connection is lost, 'on_lost' is called and the manager
+        reconnects in the background and requests the lock again.
+        :param name: the name of the lock
+        :param on_acquired: function called when the lock is acquired after
+        having been queued
+        :param on_lost: function called when the lock is stolen or the
+        connection is lost
+        :return: OvsdbLock, which has to be acquired
+        """
+        if self.query.connection is None:
+            self.query.connection = self._connect(write=True)
+            self.query.connection.add_close_handler(self._resume_session)
+        self.query.lock_name = name
+        lock = OvsdbLock(self.query, name, on_acquired, on_lost)
+        self.locks.append(lock)
+        return lock
+
+    def _connect(self, write: bool) -> OvsdbConnection:
+        if self.cluster is not None:
+            return self.cluster.connect(write)
+        return OvsdbConnection(self.query.ip, self.query.port)
+
+    def _resume_replica(self, error):
+        if error is not None:
+            self._reconnect(False, self.replica.resume, self._resume_replica)
+
+    def _resume_session(self, error):
+        if error is not None:
+            self._reconnect(True, self._resume_locks, self._resume_session)
+
+    def _resume_locks(self, connection: OvsdbConnection):
+        self.query.connection = connection
+        for lock in self.locks:
+            lock.resume()
+
+    def _reconnect(self, write: bool, resume: Callable, close_handler: Callable):
+        # Opens a new connection in the background and passes it to
+        # 'resume'. It keeps trying, with a capped jittered backoff, until
+        # it succeeds or the manager is closed.
+        with self._reconnect_lock:
+            if close_handler in self._reconnecting or self._closed.is_set():
+                return
+            self._reconnecting.add(close_handler)
+
+        def reconnect():
+            attempt = 0
+            while not self._closed.is_set():
+                connection = None
+                try:
+                    connection = self._connect(write)
+                    connection.add_close_handler(close_handler)
+                    resume(connection)
+                except (OSError, OvsdbQueryException):
+                    if connection is not None:
+                        connection.close()
+                else:
+                    with self._reconnect_lock:
+                        # If the new connection is already lost, its close
+                        # handler found this reconnection still running
+                        if not connection.closed:
+                            self._reconnecting.discard(close_handler)
+                            return
+                self._closed.wait(jittered_backoff(min(attempt, MAX_RETRIES),
+                                                   BACKOFF_BASE, BACKOFF_MAX))
+                attempt += 1
+            with self._reconnect_lock:
+                self._reconnecting.discard(close_handler)
+        threading.Thread(target=reconnect, daemon=True).start()
+
+    def close(self):
+        """
+        Closes the connections of the manager (replica, lock session and
+        coalescing writer) and stops reconnecting them
+        :return:
+        """
+        self._closed.set()
+        if self.writer:
+            self.writer.close()
+        if self.feed:
+            self.feed.close()
+        if self.replica:
+            self.replica.connection.close()
+        if self.query.connection:
+            self.query.connection.close()
+
+    def get_table_raw(self, table: str) -> List[Dict]:
+        # While the replica is reconnecting its rows may be outdated, so
+        # the server is queried instead
+        if self.replica and table in self.replica.tables and not self.replica.connection.closed:
+            return [dict(row) for row in self.replica.select(table)]
         return self.query.select_from_table(table)["result"][0]["rows"]
 
     def get_openvswitch(self) -> OpenVSwitch:
@@ -51,8 +270,8 @@ class OvsdbManager:
     def list_dbs(self):
         return self.query.list_dbs()["result"]
 
-    def get_schema(self, db: str):
-        return self.query.get_schema(db)["result"]
+    def get_schema(self, db: str = None):
+        return self.query.schema(db).raw
 
     def get_bridges(self):
         bridges_raw = self.query.select_from_table("Bridge")
@@ -69,35 +288,71 @@ class OvsdbManager:
 
     def add_bridge(self, name: str):
         bridge_id, interface_id, port_id = [generate_uuid() for _ in range(3)]
-        bridges = [bridge.uuid for bridge in self.get_bridges()] + [named_uuid(bridge_id)]
-        ops = [
-            operation.insert("Interface",
-                             row={"name": name,
-                                  "type": "internal"},
-                             uuid_name=interface_id),
-            operation.insert("Port",
-                             row={"name": name,
-                                  "interfaces": named_uuid(interface_id)},
-                             uuid_name=port_id),
-            operation.insert("Bridge",
-                             row={"name": name,
-                                  "ports": named_uuid(port_id)},
-                             uuid_name=bridge_id),
-            operation.update("Open_vSwitch",
-                             where=[get_by_uuid(self.get_openvswitch().uuid)],
-                             row={"bridges": ["set", bridges]}),
-        ]
-        bridge_raw = self.query.multiple_ops(ops)
-
-        return self.get_bridge(uuid=bridge_raw["result"][2]["uuid"])
+
+        def build_ops():
+            ovs = self.get_openvswitch()
+            bridges = getattr(ovs, "bridges")
+            return [
+                operation.wait("Open_vSwitch",
+                               where=[get_by_uuid(ovs.uuid)],
+                               columns=["bridges"],
+                               rows=[{"bridges": bridges}]),
+                operation.insert("Interface",
+                                 row={"name": name,
+                                      "type": "internal"},
+                                 uuid_name=interface_id),
+                operation.insert("Port",
+                                 row={"name": name,
+                                      "interfaces": named_uuid(interface_id)},
+                                 uuid_name=port_id),
+                operation.insert("Bridge",
+                                 row={"name": name,
+                                      "ports": named_uuid(port_id)},
+                                 uuid_name=bridge_id),
+                operation.update("Open_vSwitch",
+                                 where=[get_by_uuid(ovs.uuid)],
+                                 row={"bridges": ["set", parse_set(bridges) +
+                                                  [named_uuid(bridge_id)]]}),
+            ]
+        bridge_raw = self.query.transact_with_retry(build_ops)
+
+        return self.get_bridge(uuid=bridge_raw["result"][3]["uuid"])
 
     def del_bridge(self, bridge: OvsBridge):
         if not bridge:
             raise OvsdbQueryException("Please provide a bridge")
-        other_bridges = [br.uuid for br in self.get_bridges() if br.uuid != bridge.uuid]
-        self.query.update_table("Open_vSwitch",
-                                row={"bridges": ["set", other_bridges]},
-                                where=[get_by_uuid(self.get_openvswitch().uuid)])
+
+        def build_ops():
+            ovs = self.get_openvswitch()
+            bridges = getattr(ovs, "bridges")
+            return [
+                operation.wait("Open_vSwitch",
+                               where=[get_by_uuid(ovs.uuid)],
+                               columns=["bridges"],
+                               rows=[{"bridges": bridges}]),
+                operation.update("Open_vSwitch",
+                                 where=[get_by_uuid(ovs.uuid)],
+                                 row={"bridges": ["set", [br for br in parse_set(bridges)
+                                                          if br != bridge.uuid]]}),
+            ]
+        self.query.transact_with_retry(build_ops)
+
+    def create_topology(self, topology: Topology) -> Dict[str, OvsBridge]:
+        """
+        Creates a set of bridges connected by patch ports in a single
+        transaction: either the whole topology is created or nothing is.
+        The bridges that already exist are kept, and only their patch
+        ports are added.
+        :param topology: the topology
+        :return: the bridges of the topology, by name
+        """
+        def build_ops():
+            existing = {row["name"]: row["_uuid"] for row in self.get_table_raw("Bridge")}
+            return topology.build_ops(existing)
+        self.query.transact_with_retry(build_ops)
+
+        return {getattr(bridge, "name"): bridge for bridge in self.get_bridges()
+                if getattr(bridge, "name") in topology.bridges}
 
     def del_bridges(self):
         self.query.update_table("Open_vSwitch",
@@ -0,0 +1,326 @@
+"""
+ovsdb-batch - ovs-vsctl style command line tool that sends any number of
+commands in a single transaction.
+
+Commands are separated by "--" on the command line, or given one per
+line in a file (or stdin) with -f:
+
+    ovsdb-batch add-br br0 -- add-port br0 p1 -- set-fail-mode br0 secure
+    ovsdb-batch -f commands.txt
+
+The supported commands are:
+
+    [--may-exist] add-br BRIDGE
+    [--if-exists] del-br BRIDGE
+    [--may-exist] add-port BRIDGE PORT
+    [--if-exists] del-port [BRIDGE] PORT
+    set-controller BRIDGE TARGET...
+    del-controller BRIDGE
+    set-fail-mode BRIDGE standalone|secure
+    del-fail-mode BRIDGE
+    set TABLE RECORD COLUMN[:KEY]=VALUE...
+
+In "set", TABLE is Bridge, Port or Interface and RECORD is a name (or
+Open_vSwitch and "."). VALUE is converted to the type of the column in
+the schema of the database (e.g. true for booleans, 10 for integers,
+text for strings, which may also be quoted as in JSON). A comma
+separated list is a set and "[]" empties a set or a map. Maps are set
+one key at a time with COLUMN:KEY=VALUE.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import argparse
+import shlex
+import sys
+from typing import Dict, List
+
+from ovsdbmanager import operation
+from ovsdbmanager.condition import get_by_name, get_by_uuid
+from ovsdbmanager.db.bridge import FailMode
+from ovsdbmanager.exception import OvsdbQueryException, OvsdbResourceNotFoundException
+from ovsdbmanager.query import OvsdbQuery
+from ovsdbmanager.utils import generate_uuid, named_uuid, parse_set
+
+NAMED_TABLES = ["Bridge", "Port", "Interface"]
+COMMAND_OPTIONS = ["--may-exist", "--if-exists"]
+
+
+class Batch:
+    """
+    Compiles a list of commands into the operations of a single
+    transaction. The current bridges, ports and interfaces are read once
+    beforehand, and the rows created by previous commands of the batch are
+    referenced by their named-uuid.
+    """
+
+    def __init__(self, query: OvsdbQuery):
+        self.query = query
+        self.ops = []
+        self.records = {table: {} for table in NAMED_TABLES}
+        self.port_bridge = {}
+        self.new_rows = {}
+        self._read_state()
+
+    def add(self, command: List[str]):
+        """
+        Compiles a command and adds its operations to the transaction
+        :param command: the command and its arguments
+        :return:
+        """
+        options = [arg for arg in command if arg.startswith("--")]
+        args = [arg for arg in command if not arg.startswith("--")]
+        if not args or args[0] not in COMMANDS:
+            raise OvsdbQueryException("Unknown command '{}'".format(" ".join(command)))
+        handler, min_args, max_args = COMMANDS[args[0]]
+        if not min_args <= len(args) - 1 <= max_args:
+            raise OvsdbQueryException("Wrong number of arguments for '{}'".format(args[0]))
+        handler(self, options, *args[1:])
+
+    def commit(self) -> Dict:
+        """
+        Sends all the operations in a single transaction
+        :return: the response to the transaction
+        """
+        if not self.ops:
+            return {"result": []}
+        return self.query.multiple_ops(self.ops)
+
+    def _read_state(self):
+        response = self.query.multiple_ops([
+            operation.select("Open_vSwitch", columns=["_uuid"]),
+            operation.select("Bridge", columns=["_uuid", "name", "ports"]),
+            operation.select("Port", columns=["_uuid", "name"]),
+            operation.select("Interface", columns=["_uuid", "name"]),
+        ])
+        ovs, bridges, ports, interfaces = [result["rows"] for result in response["result"]]
+        self.ovs_uuid = ovs[0]["_uuid"]
+        for table, rows in zip(NAMED_TABLES, [bridges, ports, interfaces]):
+            self.records[table] = {row["name"]: row["_uuid"] for row in rows}
+        port_names = {row["_uuid"][1]: row["name"] for row in ports}
+        for bridge in bridges:
+            for port in parse_set(bridge["ports"]):
+                self.port_bridge[port_names.get(port[1])] = bridge["name"]
+
+    def find(self, table: str, name: str):
+        if name not in self.records[table]:
+            raise OvsdbResourceNotFoundException("{} '{}' not found".format(table, name))
+        return self.records[table][name]
+
+    def insert(self, table: str, name: str, row: Dict):
+        uuid_name = generate_uuid()
+        row = dict(row, name=name)
+        self.ops.append(operation.insert(table, row=row, uuid_name=uuid_name))
+        self.records[table][name] = named_uuid(uuid_name)
+        self.new_rows[(table, name)] = row
+        return named_uuid(uuid_name)
+
+    def update(self, table: str, name: str, row: Dict):
+        if (table, name) in self.new_rows:
+            self.new_rows[(table, name)].update(row)
+        else:
+            self.ops.append(operation.update(table, row=row, where=self._where(table, name)))
+
+    def set_key(self, table: str, name: str, column: str, key: str, value):
+        row = self.new_rows.get((table, name))
+        if row is not None:
+            pairs = [pair for pair in row.get(column, ["map", []])[1] if pair[0] != key]
+            row[column] = ["map", pairs + [[key, value]]]
+            return
+        self.ops.append(operation.mutate(table, where=self._where(table, name), mutations=[
+            [column, "delete", ["set", [key]]],
+            [column, "insert", ["map", [[key, value]]]]]))
+
+    def add_to_set(self, table: str, name: str, column: str, uuid):
+        row = self.new_rows.get((table, name))
+        if row is not None:
+            row[column] = ["set", parse_set(row.get(column, ["set", []])) + [uuid]]
+            return
+        self.ops.append(operation.mutate(table, where=self._where(table, name), mutations=[
+            [column, "insert", ["set", [uuid]]]]))
+
+    def _where(self, table: str, name: str) -> List:
+        if table == "Open_vSwitch":
+            return [get_by_uuid(self.ovs_uuid)]
+        self.find(table, name)
+        return [get_by_name(name)]
+
+
+def add_br(batch: Batch, options: List[str], bridge: str):
+    if bridge in batch.records["Bridge"]:
+        if "--may-exist" in options:
+            return
+        raise OvsdbQueryException("Bridge '{}' already exists".format(bridge))
+    interface = batch.insert("Interface", bridge, {"type": "internal"})
+    port = batch.insert("Port", bridge, {"interfaces": interface})
+    bridge_uuid = batch.insert("Bridge", bridge, {"ports": ["set", [port]]})
+    batch.port_bridge[bridge] = bridge
+    batch.add_to_set("Open_vSwitch", ".", "bridges", bridge_uuid)
+
+
+def del_br(batch: Batch, options: List[str], bridge: str):
+    if bridge not in batch.records["Bridge"] and "--if-exists" in options:
+        return
+    bridge_uuid = batch.find("Bridge", bridge)
+    batch.ops.append(operation.mutate("Open_vSwitch", where=[get_by_uuid(batch.ovs_uuid)],
+                                      mutations=[["bridges", "delete", ["set", [bridge_uuid]]]]))
+    del batch.records["Bridge"][bridge]
+    batch.new_rows.pop(("Bridge", bridge), None)
+    for port in [port for port, owner in batch.port_bridge.items() if owner == bridge]:
+        del batch.port_bridge[port]
+        batch.records["Port"].pop(port, None)
+
+
+def add_port(batch: Batch, options: List[str], bridge: str, port: str):
+    batch.find("Bridge", bridge)
+    if port in batch.records["Port"]:
+        if "--may-exist" in options and batch.port_bridge.get(port) == bridge:
+            return
+        raise OvsdbQueryException("Port '{}' already exists".format(port))
+    interface = batch.insert("Interface", port, {})
+    port_uuid = batch.insert("Port", port, {"interfaces": interface})
+    batch.port_bridge[port] = bridge
+    batch.add_to_set("Bridge", bridge, "ports", port_uuid)
+
+
+def del_port(batch: Batch, options: List[str], *args: str):
+    port = args[-1]
+    if port not in batch.records["Port"] and "--if-exists" in options:
+        return
+    port_uuid = batch.find("Port", port)
+    bridge = batch.port_bridge.get(port)
+    if bridge is None or (len(args) == 2 and args[0] != bridge):
+        raise OvsdbResourceNotFoundException("Port '{}' not found in bridge '{}'".format(
+            port, args[0] if len(args) == 2 else None))
+    batch.ops.append(operation.mutate("Bridge", where=[get_by_name(bridge)],
+                                      mutations=[["ports", "delete", ["set", [port_uuid]]]]))
+    del batch.records["Port"][port]
+    del batch.port_bridge[port]
+
+
+def set_controller(batch: Batch, _options: List[str], bridge: str, *targets: str):
+    controllers = []
+    for target in targets:
+        controller_id = generate_uuid()
+        batch.ops.append(operation.insert("Controller", row={"role": "other", "target": target},
+                                          uuid_name=controller_id))
+        controllers.append(named_uuid(controller_id))
+    batch.update("Bridge", bridge, {"controller": ["set", controllers]})
+
+
+def del_controller(batch: Batch, _options: List[str], bridge: str):
+    batch.update("Bridge", bridge, {"controller": ["set", []]})
+
+
+def set_fail_mode(batch: Batch, _options: List[str], bridge: str, mode: str):
+    batch.update("Bridge", bridge, {"fail_mode": FailMode(mode).value})
+
+
+def del_fail_mode(batch: Batch, _options: List[str], bridge: str):
+    batch.update("Bridge", bridge, {"fail_mode": ["set", []]})
+
+
+def set_columns(batch: Batch, _options: List[str], table: str, record: str, *assignments: str):
+    if table not in NAMED_TABLES + ["Open_vSwitch"]:
+        raise OvsdbQueryException("Unsupported table '{}'".format(table))
+    schema = batch.query.schema()
+    for assignment in assignments:
+        column, _, value = assignment.partition("=")
+        column, _, key = column.partition(":")
+        column_type = schema.column_type(table, column)
+        if key:
+            if not column_type.is_map:
+                raise OvsdbQueryException("{}.{} is not a map".format(table, column))
+            batch.set_key(table, record, column, column_type.key.parse(key),
+                          column_type.value.parse(value))
+        else:
+            batch.update(table, record, {column: column_type.parse(value)})
+
+
+COMMANDS = {
+    "add-br": (add_br, 1, 1),
+    "del-br": (del_br, 1, 1),
+    "add-port": (add_port, 2, 2),
+    "del-port": (del_port, 1, 2),
+    "set-controller": (set_controller, 2, sys.maxsize),
+    "del-controller": (del_controller, 1, 1),
+    "set-fail-mode": (set_fail_mode, 2, 2),
+    "del-fail-mode": (del_fail_mode, 1, 1),
+    "set": (set_columns, 3, sys.maxsize),
+}
+
+
+def split_commands(args: List[str]) -> List[List[str]]:
+    """
+    Splits the command line arguments into commands
+    :param args: the arguments, with the commands separated by "--"
+    :return: the list of commands
+    """
+    commands = [[]]
+    for arg in args:
+        if arg == "--":
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    return [command for command in commands if command]
+
+
+def read_commands(lines) -> List[List[str]]:
+    """
+    Reads one command per line, ignoring empty lines and comments
+    :param lines: iterable of lines
+    :return: the list of commands
+    """
+    commands = [shlex.split(line, comments=True) for line in lines]
+    return [command for command in commands if command]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [options] COMMAND [ARG...] [-- COMMAND [ARG...]]...",
+        description="Send several ovs-vsctl style commands in a single transaction",
+        epilog="commands: " + ", ".join(COMMANDS))
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6640)
+    parser.add_argument("--db", default="Open_vSwitch")
+    parser.add_argument("-f", "--file", help="file with one command per line, - for stdin")
+    argv = sys.argv[1:] if argv is None else argv
+    first_command = next((index for index, arg in enumerate(argv)
+                          if arg in COMMANDS or arg in COMMAND_OPTIONS), len(argv))
+    args = parser.parse_args(argv[:first_command])
+
+    commands = split_commands(argv[first_command:])
+    if args.file == "-":
+        commands += read_commands(sys.stdin)
+    elif args.file:
+        with open(args.file) as f:
+            commands += read_commands(f)
+
+    try:
+        batch = Batch(OvsdbQuery(args.ip, args.port, args.db))
+        for command in commands:
+            batch.add(command)
+        batch.commit()
+    except (OvsdbQueryException, ValueError, OSError) as e:
+        print("ovsdb-batch: {}".format(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
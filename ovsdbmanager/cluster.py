@@ -0,0 +1,208 @@
+"""
+OvsdbCluster - Class that routes the requests to the members of a
+clustered (Raft) OVSDB database.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import contextlib
+import itertools
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from ovsdbmanager import method, operation
+from ovsdbmanager.condition import get_by_name
+from ovsdbmanager.connection import OvsdbConnection
+from ovsdbmanager.exception import OvsdbQueryException
+from ovsdbmanager.pool import OvsdbConnectionPool, POOL_SIZE
+from ovsdbmanager.utils import jittered_backoff
+
+SERVER_DB = "_Server"
+SESSION_METHODS = ["lock", "steal", "unlock"]
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.1
+BACKOFF_MAX = 2.
+# Seconds after a write during which the reads are also sent to the
+# leader, so that they see the write even if the followers lag behind
+READ_AFTER_WRITE = 1.
+
+
+class OvsdbCluster:
+    """
+    Keeps track of the leader of a clustered database, which is found
+    through the "Database" table of the "_Server" database of each member.
+    Write transactions are sent to the leader, while reads are spread
+    across the followers. When a member is unreachable or the leader
+    changes, the members are queried again and the request is retried.
+    """
+
+    def __init__(self, remotes: List[Tuple[str, int]], db: str = "Open_vSwitch",
+                 pool_size: int = POOL_SIZE):
+        if not remotes:
+            raise OvsdbQueryException("Please provide at least one remote")
+        self.remotes = [(ip, int(port)) for ip, port in remotes]
+        self.db = db
+        self.leader = None
+        self.followers = []
+        self.pools = {remote: OvsdbConnectionPool(remote[0], remote[1], size=pool_size)
+                      for remote in self.remotes}
+        self._lock = threading.Lock()
+        self._readers = iter(())
+        self._last_write = None
+        self._local = threading.local()
+
+    def discover(self):
+        """
+        Queries all the members to find the current leader and the
+        followers connected to the cluster
+        :return:
+        """
+        leader, followers = None, []
+        for remote in self.remotes:
+            status = self._status(remote)
+            if status is None or not status.get("connected", True):
+                continue
+            if status.get("model") != "clustered" or status.get("leader"):
+                leader = leader or remote
+            else:
+                followers.append(remote)
+        if leader is None:
+            raise OvsdbQueryException("No leader found for database '{}'".format(self.db))
+        with self._lock:
+            self.leader = leader
+            self.followers = followers
+            self._readers = itertools.cycle(followers or [leader])
+
+    def send(self, query: Dict) -> Dict:
+        """
+        Sends a request to the leader if it is a write, or to a follower
+        otherwise
+        :param query: the request payload
+        :return: the response to the request
+        """
+        write = is_write(query)
+        leader = write or self._read_from_leader()
+        for attempt in range(MAX_RETRIES):
+            try:
+                pool = self.pools[self._pick(leader)]
+                conn = pool.acquire()
+            except (OSError, OvsdbQueryException):
+                # The member is unreachable or there is no leader (e.g.
+                # during an election): find the members again later
+                self._wait_for_members(attempt)
+                continue
+            if write:
+                self._last_write = time.monotonic()
+            try:
+                response = conn.call(query)
+            except (OSError, OvsdbQueryException):
+                if write:
+                    # The transaction may have been committed before the
+                    # connection failed, sending it again could apply it twice
+                    self._forget_leader()
+                    raise
+                self._wait_for_members(attempt)
+                continue
+            finally:
+                pool.release(conn)
+            if write and _not_leader(response):
+                self._forget_leader()
+                continue
+            return response
+        raise OvsdbQueryException("No cluster member could handle the request")
+
+    @contextlib.contextmanager
+    def leader_reads(self):
+        """
+        Context manager that sends the reads done by the current thread to
+        the leader, e.g. the reads of a read-modify-write transaction,
+        which has to see the latest committed state
+        :return:
+        """
+        depth = getattr(self._local, "leader_reads", 0)
+        self._local.leader_reads = depth + 1
+        try:
+            yield
+        finally:
+            self._local.leader_reads = depth
+
+    def connect(self, write: bool = False) -> OvsdbConnection:
+        """
+        Opens a dedicated connection to the leader, or to a follower
+        (e.g. for a monitor)
+        :param write: whether the connection is used for writes
+        :return: OvsdbConnection
+        """
+        for attempt in range(MAX_RETRIES):
+            try:
+                return OvsdbConnection(*self._pick(write))
+            except (OSError, OvsdbQueryException):
+                self._wait_for_members(attempt)
+        raise OvsdbQueryException("No cluster member could be reached")
+
+    def _read_from_leader(self) -> bool:
+        if getattr(self._local, "leader_reads", 0):
+            return True
+        last_write = self._last_write
+        return last_write is not None and time.monotonic() - last_write < READ_AFTER_WRITE
+
+    def _pick(self, write: bool) -> Tuple[str, int]:
+        if self.leader is None:
+            self.discover()
+        with self._lock:
+            return self.leader if write else next(self._readers)
+
+    def _wait_for_members(self, attempt: int):
+        self._forget_leader()
+        time.sleep(jittered_backoff(attempt, BACKOFF_BASE, BACKOFF_MAX))
+
+    def _forget_leader(self):
+        with self._lock:
+            self.leader = None
+
+    def _status(self, remote: Tuple[str, int]):
+        query = method.transact(SERVER_DB, [operation.select(
+            "Database", where=[get_by_name(self.db)],
+            columns=["model", "connected", "leader"])])
+        try:
+            with self.pools[remote].connection() as conn:
+                rows = conn.call(query)["result"][0]["rows"]
+        except (OSError, OvsdbQueryException, KeyError, TypeError, IndexError):
+            return None
+        return rows[0] if rows else None
+
+
+def is_write(query: Dict) -> bool:
+    """
+    Tells whether a request has to be sent to the leader
+    :param query: the request payload
+    :return: boolean
+    """
+    if query["method"] in SESSION_METHODS:
+        return True
+    if query["method"] != "transact":
+        return False
+    return any(op["op"] != "select" for op in query["params"][1:])
+
+
+def _not_leader(response: Dict) -> bool:
+    errors = [response.get("error")] + [result.get("error")
+                                        for result in response.get("result") or []
+                                        if isinstance(result, dict)]
+    return any("not leader" in str(error) for error in errors if error)
@@ -0,0 +1,162 @@
+"""
+CoalescingWriter - Class that merges concurrent write operations into a
+single transaction.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+from ovsdbmanager.exception import OvsdbCommitException, OvsdbSchemaViolation
+
+WINDOW = 0.005
+MAX_BATCH = 64
+
+
+class CoalescingWriter:
+    """
+    Collects the operations submitted by several threads during a short
+    window (or until 'max_batch' operations are pending) and sends them
+    in a single transaction. Updates to the same rows are merged, the
+    last value written to a column wins.
+    """
+
+    def __init__(self, query, window: float = WINDOW, max_batch: int = MAX_BATCH):
+        self.query = query
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, op: Dict) -> Future:
+        """
+        Schedules an operation to be sent in the next transaction
+        :param op: the operation, as built by the operation module
+        :return: a Future that holds the result of the operation
+        """
+        future = Future()
+        if self.query.validate:
+            # Invalid operations are rejected here, otherwise they would
+            # make the whole merged transaction fail
+            try:
+                self.query.schema().validate(op)
+            except OvsdbSchemaViolation as e:
+                future.set_exception(e)
+                return future
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._queue.put((op, future))
+        return future
+
+    def close(self):
+        """
+        Sends the pending operations and stops the writer thread
+        :return:
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0., deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._flush(batch)
+                    return
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[Dict, Future]]):
+        batch = [(op, future) for op, future in batch
+                 if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        ops, targets = _coalesce([op for op, _ in batch])
+        try:
+            results = self._transact(ops)
+        except Exception as e:  # pylint: disable=broad-except
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), target in zip(batch, targets):
+            if isinstance(results[target], Exception):
+                future.set_exception(results[target])
+            else:
+                future.set_result(results[target])
+
+    def _transact(self, ops: List[Dict]) -> List:
+        try:
+            return self.query.multiple_ops(ops)["result"]
+        except OvsdbCommitException as e:
+            if len(ops) == 1:
+                return [e]
+        # One of the operations made the whole transaction fail, send them
+        # one by one so that only the failing callers get the error
+        results = []
+        for op in ops:
+            try:
+                results.append(self.query.multiple_ops([op])["result"][0])
+            except OvsdbCommitException as e:
+                results.append(e)
+        return results
+
+
+def _coalesce(ops: List[Dict]) -> Tuple[List[Dict], List[int]]:
+    """
+    Merges the update operations that target the same rows.
+    :param ops: the list of operations
+    :return: the merged list of operations and, for each original
+    operation, the index of the operation that includes it
+    """
+    merged = []
+    targets = []
+    updates = {}
+    for op in ops:
+        if op["op"] != "update":
+            targets.append(len(merged))
+            merged.append(op)
+            continue
+        key = (op["table"], json.dumps(op["where"], sort_keys=True))
+        if key in updates:
+            target = updates[key]
+            merged[target]["row"].update(op["row"])
+        else:
+            target = updates[key] = len(merged)
+            merged.append(dict(op, row=dict(op["row"])))
+        targets.append(target)
+    return merged, targets
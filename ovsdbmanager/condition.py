@@ -6,6 +6,10 @@ A 3-element JSON array of the form [<column>, <function>, <value>]
 that represents a test on a column value.  Except as otherwise
 specified below, <value> MUST have the same type as <column>.
 
+Conditions can also be compiled and evaluated locally against rows that
+are already in memory (e.g. cached or replicated rows), following the
+semantics described in RFC 7047 section 5.1.
+
      Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
 
      This program is free software: you can redistribute it and/or modify
@@ -24,7 +28,11 @@ specified below, <value> MUST have the same type as <column>.
      Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
 """
 
-from typing import List
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional, Set
+
+COMMON_FUNCTIONS = ["==", "!=", "includes", "excludes"]
+OTHER_FUNCTIONS = ["<", "<=", ">=", ">"]
 
 
 def get_by_uuid(uuid: str) -> List[str]:
@@ -47,14 +55,166 @@ def get_by_name(name: str) -> List[str]:
     return _build_condition("name", "==", name)
 
 
-def _build_condition(column, function: str, value) -> List[str]:
-    common_functions = ["==", "!=", "includes", "excludes"]
-    other_functions = ["<", "<=", ">=", ">"]
+def compile_conditions(conditions: List) -> Callable[[Dict], bool]:
+    """
+    Compiles a list of conditions into a function that tells whether a
+    row matches all of them. Rows use the same JSON representation as
+    the ones returned by the server.
+
+    :param conditions: the list of conditions, as used in 'where'
+    :return: a function that receives a row and returns a boolean
+    """
+    checks = [_compile_condition(*condition) for condition in conditions]
+    return lambda row: all(check(row) for check in checks)
+
 
-    if function not in common_functions + other_functions:
+def filter_rows(rows, conditions: List, indexes: Dict = None) -> List[Dict]:
+    """
+    Gets the rows matching the conditions passed as parameter without
+    querying the server.
+
+    :param rows: the rows to filter, either a list or a dict keyed by uuid
+    :param conditions: the list of conditions, as used in 'where'
+    :param indexes: optional dict of ColumnIndex, keyed by column name,
+    built on 'rows'. They are used to narrow down the candidate rows
+    :return: the list of matching rows
+    """
+    if not isinstance(rows, Mapping):
+        rows = dict(enumerate(rows))
+    match = compile_conditions(conditions)
+
+    candidates = None
+    for column, function, value in conditions:
+        index = (indexes or {}).get(column)
+        keys = index.lookup(function, value) if index else None
+        if keys is not None and (candidates is None or len(keys) < len(candidates)):
+            candidates = keys
+    if candidates is None:
+        candidates = rows.keys()
+
+    return [rows[key] for key in candidates if key in rows and match(rows[key])]
+
+
+class ColumnIndex:
+    """
+    Index of a set of rows by the elements of one of their columns. Each
+    atom, set element or map key-value pair points to the keys of the rows
+    containing it, so '==' and 'includes' conditions on the column can
+    be answered without scanning the rows.
+    """
+
+    def __init__(self, column: str, rows=None):
+        self.column = column
+        self._entries = {}
+        if rows is not None:
+            items = rows.items() if isinstance(rows, Mapping) else enumerate(rows)
+            for key, row in items:
+                self.add(key, row)
+
+    def add(self, key, row: Dict):
+        """
+        Adds a row to the index
+        :param key: the key of the row (typically its uuid)
+        :param row: the row
+        :return:
+        """
+        for element in _normalize(row[self.column]):
+            self._entries.setdefault(element, set()).add(key)
+
+    def remove(self, key, row: Dict):
+        """
+        Removes a row from the index
+        :param key: the key of the row (typically its uuid)
+        :param row: the row, as it was when it was added
+        :return:
+        """
+        for element in _normalize(row[self.column]):
+            keys = self._entries.get(element)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._entries[element]
+
+    def lookup(self, function: str, value) -> Optional[Set]:
+        """
+        Gets the keys of the candidate rows for a condition on the column
+        :param function: the function of the condition
+        :param value: the value of the condition
+        :return: a superset of the keys of the matching rows, or None if
+        the index cannot be used for this condition
+        """
+        if function not in ["==", "includes"]:
+            return None
+        elements = _normalize(value)
+        if not elements:
+            return None
+        keys = None
+        for element in elements:
+            element_keys = self._entries.get(element, set())
+            keys = element_keys if keys is None else keys & element_keys
+            if not keys:
+                return set()
+        return set(keys)
+
+
+def _compile_condition(column, function: str, value) -> Callable[[Dict], bool]:
+    _build_condition(column, function, value)
+
+    if function in OTHER_FUNCTIONS:
+        return lambda row: _compare(_scalar(row[column]), function, value)
+
+    expected = _normalize(value)
+    if function == "==":
+        return lambda row: _normalize(row[column]) == expected
+    if function == "!=":
+        return lambda row: _normalize(row[column]) != expected
+    if function == "includes":
+        return lambda row: expected <= _normalize(row[column])
+    return lambda row: expected.isdisjoint(_normalize(row[column]))
+
+
+def _normalize(value) -> frozenset:
+    """
+    Converts an OVSDB value into a frozenset of hashable elements: atoms
+    for sets (a single atom is a set of one element) and (key, value)
+    tuples for maps.
+    """
+    if isinstance(value, list) and value and value[0] == "set":
+        return frozenset(_atom(element) for element in value[1])
+    if isinstance(value, list) and value and value[0] == "map":
+        return frozenset((_atom(key), _atom(val)) for key, val in value[1])
+    return frozenset([_atom(value)])
+
+
+def _atom(atom):
+    if isinstance(atom, list):
+        return tuple(atom)
+    return atom
+
+
+def _scalar(value):
+    if isinstance(value, list) and value and value[0] == "set":
+        return value[1][0] if len(value[1]) == 1 else None
+    return value
+
+
+def _compare(current, function: str, value) -> bool:
+    if isinstance(current, bool) or not isinstance(current, (int, float)):
+        return False
+    if function == "<":
+        return current < value
+    if function == "<=":
+        return current <= value
+    if function == ">=":
+        return current >= value
+    return current > value
+
+
+def _build_condition(column, function: str, value) -> List[str]:
+    if function not in COMMON_FUNCTIONS + OTHER_FUNCTIONS:
         raise TypeError("Unsupported function")
 
-    if not isinstance(value, (int, float)) and function in other_functions:
+    if not isinstance(value, (int, float)) and function in OTHER_FUNCTIONS:
         raise TypeError("Invalid function for value type {}".format(type(value).__name__))
 
     return [column, function, value]
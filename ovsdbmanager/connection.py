@@ -0,0 +1,241 @@
+"""
+OvsdbConnection - Persistent JSON-RPC session with an OVSDB server
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import codecs
+import json
+import logging
+import re
+import socket
+import threading
+import time
+from typing import Callable, Dict
+
+from ovsdbmanager import method
+
+TIMEOUT = 5
+PROBE_INTERVAL = 5
+BUFSIZE = 65536
+# Characters that delimit the JSON messages, see _scan
+TOKENS = re.compile(r'[\\"{}\[\]]')
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OvsdbConnection:
+    """
+    A socket to an OVSDB server that is kept open between requests. A
+    background thread reads everything the server sends: responses are
+    handed to the threads waiting for them, echo requests are answered on
+    the same socket and notifications (e.g. monitor updates) are passed
+    to the registered handlers.
+
+    If nothing is received for 'probe_interval' seconds an echo request
+    is sent to the server, and the connection is closed if it is not
+    answered within another 'probe_interval' seconds.
+    """
+
+    def __init__(self, ip: str, port: int, timeout: float = TIMEOUT,
+                 probe_interval: float = PROBE_INTERVAL):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.probe_interval = probe_interval
+        self.closed = False
+        self.last_used = time.monotonic()
+        self._sock = socket.create_connection((ip, port), timeout)
+        self._sock.settimeout(probe_interval or None)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._handlers = {}
+        self._close_handlers = []
+        self._probe_sent = False
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = -1
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def call(self, query: Dict, timeout: float = None) -> Dict:
+        """
+        Sends a request and waits for its response
+        :param query: the request payload, as built by the method module
+        :param timeout: seconds to wait for the response. If not present,
+        the connection timeout is used
+        :return: the response to the request
+        """
+        pending = _PendingCall()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            self._pending[query["id"]] = pending
+        try:
+            self.send(query)
+            if not pending.done.wait(self.timeout if timeout is None else timeout):
+                raise socket.timeout("No response to '{}' request".format(query["method"]))
+        finally:
+            with self._lock:
+                self._pending.pop(query["id"], None)
+        if pending.error is not None:
+            raise pending.error
+        self.last_used = time.monotonic()
+        return pending.response
+
+    def send(self, message: Dict):
+        """
+        Sends a message without waiting for any response
+        :param message: the payload to send
+        :return:
+        """
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        with self._write_lock:
+            self._sock.sendall(json.dumps(message).encode())
+
+    def add_handler(self, method_name: str, handler: Callable):
+        """
+        Registers a function to be called when the server sends a
+        notification
+        :param method_name: the method of the notification (e.g. "update")
+        :param handler: function that receives the params of the
+        notification
+        :return:
+        """
+        self._handlers.setdefault(method_name, []).append(handler)
+
+    def add_close_handler(self, handler: Callable):
+        """
+        Registers a function to be called when the connection is closed
+        :param handler: function that receives the error that closed the
+        connection, or None if it was closed by the client
+        :return:
+        """
+        self._close_handlers.append(handler)
+
+    def close(self):
+        """
+        Closes the connection
+        :return:
+        """
+        self._shutdown(None)
+
+    def _shutdown(self, error):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        for call in pending.values():
+            call.error = error or ConnectionError("Connection closed")
+            call.done.set()
+        for handler in self._close_handlers:
+            handler(error)
+
+    def _read_loop(self):
+        try:
+            while not self.closed:
+                try:
+                    message = self._read()
+                except socket.timeout:
+                    self._probe()
+                    continue
+                self._probe_sent = False
+                self._dispatch(message)
+        except (OSError, ValueError) as e:
+            self._shutdown(None if self.closed else e)
+
+    def _probe(self):
+        if self._probe_sent:
+            raise ConnectionError("Inactivity probe to {}:{} timed out".format(
+                self.ip, self.port))
+        self._probe_sent = True
+        self.send(method.echo())
+
+    def _dispatch(self, message: Dict):
+        if "method" not in message:
+            with self._lock:
+                call = self._pending.get(message.get("id"))
+            if call is not None:
+                call.response = message
+                call.done.set()
+            return
+        if message["method"] == "echo":
+            self.send(method.echo_reply(message["params"], message["id"]))
+            return
+        for handler in self._handlers.get(message["method"], []):
+            try:
+                handler(message["params"])
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Error handling '%s' notification", message["method"])
+
+    def _read(self) -> Dict:
+        while True:
+            end = self._scan()
+            if end is not None:
+                message = self._decoder.decode(self._buf[:end])
+                self._buf = self._buf[end:]
+                self._scanned = 0
+                self._escaped = -1
+                return message
+            data = self._sock.recv(BUFSIZE)
+            if not data:
+                raise ConnectionError("Connection closed by the server")
+            self._buf += self._utf8.decode(data)
+
+    def _scan(self):
+        # Finds the end of the first complete message of the buffer. The
+        # scan resumes where the previous one stopped, so big messages
+        # received in many chunks are not parsed again for each chunk.
+        for match in TOKENS.finditer(self._buf, self._scanned):
+            char, position = match.group(), match.start()
+            if self._in_string:
+                if position == self._escaped:
+                    continue
+                if char == "\\":
+                    self._escaped = position + 1
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    return match.end()
+        self._scanned = len(self._buf)
+        return None
+
+
+class _PendingCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
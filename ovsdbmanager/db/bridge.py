@@ -23,7 +23,7 @@ from typing import List
 
 from ovsdbmanager import operation
 from ovsdbmanager.exception import OvsdbResourceNotFoundException, OvsdbQueryException
-from ovsdbmanager.utils import generate_uuid, named_uuid
+from ovsdbmanager.utils import generate_uuid, named_uuid, parse_set
 from ovsdbmanager.condition import get_by_uuid
 from ovsdbmanager.db.ovs import OpenVSwitch
 from ovsdbmanager.db.port import OvsPort
@@ -40,19 +40,28 @@ class OvsBridge(OpenVSwitch):
     Class that represents an OvS bridge. Currently it implements the
     basic operations that can be done to it.
     """
+    TABLE = "Bridge"
 
     def _update_bridge_object(self):
         self.__dict__ = self.api.get_bridge(uuid=self.uuid).__dict__
 
+    def _read_ports(self):
+        self._update_bridge_object()
+        return getattr(self, "ports")
+
+    def _wait_ports(self, ports):
+        return operation.wait("Bridge",
+                              where=[get_by_uuid(self.uuid)],
+                              columns=["ports"],
+                              rows=[{"ports": ports}])
+
     def set_stp(self, enabled: bool):
         """
         Sets the STP parameter of the bridge.
         :param enabled: boolean that represents the stp state.
         :return:
         """
-        self.api.query.update_table("Bridge",
-                                    row={"stp_enable": enabled},
-                                    where=[get_by_uuid(self.uuid)])
+        self.api.update_row("Bridge", self.uuid, {"stp_enable": enabled})
         self._update_bridge_object()
 
     def set_rstp(self, enabled: bool):
@@ -61,9 +70,7 @@ class OvsBridge(OpenVSwitch):
         :param enabled: boolean that represents the rstp state.
         :return:
         """
-        self.api.query.update_table("Bridge",
-                                    row={"rstp_enable": enabled},
-                                    where=[get_by_uuid(self.uuid)])
+        self.api.update_row("Bridge", self.uuid, {"rstp_enable": enabled})
         self._update_bridge_object()
 
     def set_fail_mode(self, mode: FailMode):
@@ -72,9 +79,7 @@ class OvsBridge(OpenVSwitch):
         :param mode: the mode
         :return:
         """
-        self.api.query.update_table("Bridge",
-                                    row={"fail_mode": mode.value},
-                                    where=[get_by_uuid(self.uuid)])
+        self.api.update_row("Bridge", self.uuid, {"fail_mode": mode.value})
         self._update_bridge_object()
 
     def get_controller(self) -> OvsController:
@@ -110,9 +115,7 @@ class OvsBridge(OpenVSwitch):
         :param protocols: list of supported protocols
         :return:
         """
-        self.api.query.update_table("Bridge",
-                                    where=[get_by_uuid(self.uuid)],
-                                    row={"protocols": ["set", protocols]})
+        self.api.update_row("Bridge", self.uuid, {"protocols": ["set", protocols]})
         self._update_bridge_object()
 
     def get_port(self, name) -> OvsPort:
@@ -159,24 +162,28 @@ class OvsBridge(OpenVSwitch):
             except OvsdbResourceNotFoundException:
                 pass
         port_id, interface_id = [generate_uuid() for _ in range(2)]
-        all_ports_uuid = [p.uuid for p in self.get_ports()] + [named_uuid(port_id)]
         interface = {"name": port}
         if patch_peer:
             interface["type"] = "patch"
             interface["options"] = ["map", [["peer", patch_peer]]]
-        ops = [
-            operation.insert("Interface",
-                             row=interface,
-                             uuid_name=interface_id),
-            operation.insert("Port",
-                             row={"name": port,
-                                  "interfaces": named_uuid(interface_id)},
-                             uuid_name=port_id),
-            operation.update("Bridge",
-                             where=[get_by_uuid(self.uuid)],
-                             row={"ports": ["set", all_ports_uuid]})
-        ]
-        response = self.api.query.multiple_ops(ops)
+
+        def build_ops():
+            ports = self._read_ports()
+            return [
+                self._wait_ports(ports),
+                operation.insert("Interface",
+                                 row=interface,
+                                 uuid_name=interface_id),
+                operation.insert("Port",
+                                 row={"name": port,
+                                      "interfaces": named_uuid(interface_id)},
+                                 uuid_name=port_id),
+                operation.update("Bridge",
+                                 where=[get_by_uuid(self.uuid)],
+                                 row={"ports": ["set", parse_set(ports) +
+                                                [named_uuid(port_id)]]})
+            ]
+        response = self.api.query.transact_with_retry(build_ops)
         self._update_bridge_object()
         return response
 
@@ -188,10 +195,17 @@ class OvsBridge(OpenVSwitch):
         """
         if not port:
             raise OvsdbQueryException("Please provide a port")
-        new_ports = [p.uuid for p in self.get_ports() if p.uuid != port.uuid]
-        self.api.query.update_table("Bridge",
-                                    row={"ports": ["set", new_ports]},
-                                    where=[get_by_uuid(self.uuid)])
+
+        def build_ops():
+            ports = self._read_ports()
+            return [
+                self._wait_ports(ports),
+                operation.update("Bridge",
+                                 row={"ports": ["set", [p for p in parse_set(ports)
+                                                        if p != port.uuid]]},
+                                 where=[get_by_uuid(self.uuid)])
+            ]
+        self.api.query.transact_with_retry(build_ops)
         self._update_bridge_object()
 
     def del_ports(self):
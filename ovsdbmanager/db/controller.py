@@ -21,7 +21,6 @@ OvsController class.
 from enum import Enum
 
 from ovsdbmanager.db.ovs import OpenVSwitch
-from ovsdbmanager.condition import get_by_uuid
 
 
 class ConnectionMode(Enum):
@@ -33,6 +32,8 @@ class OvsController(OpenVSwitch):
     """
     Class that represents an OvS controller.
     """
+    TABLE = "Controller"
+
     def _update_controller_object(self):
         self.__dict__ = self.api.get_controller(uuid=self.uuid).__dict__
 
@@ -42,9 +43,7 @@ class OvsController(OpenVSwitch):
         :param mode: the mode
         :return:
         """
-        self.api.query.update_table("Controller",
-                                    row={"connection_mode": mode.value},
-                                    where=[get_by_uuid(self.uuid)])
+        self.api.update_row("Controller", self.uuid, {"connection_mode": mode.value})
         self._update_controller_object()
 
 
@@ -23,4 +23,4 @@ from ovsdbmanager.db.ovs import OpenVSwitch
 
 
 class OvsInterface(OpenVSwitch):
-    pass
+    TABLE = "Interface"
@@ -20,9 +20,14 @@ OpenVSwitch class - base class for all the db.
 """
 
 import json
+from typing import Dict
+
+from ovsdbmanager.utils import add_to_map, del_from_map
 
 
 class OpenVSwitch:
+    TABLE = "Open_vSwitch"
+
     def __init__(self, data, api):
         self.__dict__ = data
         self.api = api
@@ -38,3 +43,37 @@ class OpenVSwitch:
     @property
     def uuid(self):
         return getattr(self, "_uuid")
+
+    def set_key(self, column: str, key: str, value: str):
+        """
+        Sets a key of a map column (e.g. external_ids), without rewriting
+        the rest of the map
+        :param column: the map column
+        :param key: the key
+        :param value: the value
+        :return:
+        """
+        self.update_keys(column, {key: value})
+
+    def del_key(self, column: str, key: str):
+        """
+        Deletes a key of a map column
+        :param column: the map column
+        :param key: the key
+        :return:
+        """
+        self.update_keys(column, {key: None})
+
+    def update_keys(self, column: str, keys: Dict):
+        """
+        Sets or deletes several keys of a map column in one operation
+        :param column: the map column
+        :param keys: the keys to set, with their values. The keys whose
+        value is None are deleted
+        :return:
+        """
+        self.api.update_keys(self.TABLE, column, [(self.uuid, keys)])
+        map_ = getattr(self, column, ["map", []])
+        for key, value in keys.items():
+            map_ = del_from_map(map_, key) if value is None else add_to_map(map_, key, value)
+        setattr(self, column, map_)
@@ -26,6 +26,8 @@ class OvsPort(OpenVSwitch):
     """
     Class that represents an OvS port
     """
+    TABLE = "Port"
+
     def get_interface(self):
         """
         Gets the first interface associated with a port
@@ -24,3 +24,19 @@ class OvsdbResourcesExhausted(OvsdbCommitException):
 
 class OvsdbIOError(OvsdbCommitException):
     pass
+
+
+class OvsdbPreconditionFailed(OvsdbCommitException):
+    pass
+
+
+class OvsdbPoolExhausted(OvsdbQueryException):
+    pass
+
+
+class OvsdbNotOwner(OvsdbCommitException):
+    pass
+
+
+class OvsdbSchemaViolation(OvsdbQueryException):
+    pass
@@ -0,0 +1,252 @@
+"""
+ChangeFeed - Delivers the changes of the replicated tables to several
+subscribers, each one interested in some rows and columns of a table.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import asyncio
+import collections
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from ovsdbmanager.condition import compile_conditions
+from ovsdbmanager.replica import OvsdbReplica
+
+INSERT = "insert"
+MODIFY = "modify"
+DELETE = "delete"
+
+LOGGER = logging.getLogger(__name__)
+
+# A change of a row. 'row' holds the subscribed columns of the row (its
+# last contents for deletes) and 'old' the previous value of the columns
+# changed by a modify (None otherwise).
+RowEvent = collections.namedtuple("RowEvent", ["type", "table", "uuid", "row", "old"])
+
+
+class Subscription:
+    """
+    Receives the changes of the rows of a table that match some
+    conditions. Rows entering the conditions are received as inserts and
+    rows leaving them as deletes. The events are passed to a callback or,
+    if there is none, they are read with 'async for'.
+    """
+
+    def __init__(self, feed, table: str, callback: Callable = None,
+                 columns: List[str] = None, where: List = None):
+        """
+        :param feed: the ChangeFeed delivering the events
+        :param table: the table
+        :param callback: function that receives each RowEvent. If not
+        present, the subscription has to be iterated from the event loop
+        running when it is created
+        :param columns: the columns of interest. Modifications of other
+        columns are not delivered. If not present, all the columns
+        :param where: the conditions the rows have to match
+        """
+        self.feed = feed
+        self.table = table
+        self.callback = callback
+        self.columns = columns
+        self.where = where or []
+        self.closed = False
+        self._matches = compile_conditions(self.where)
+        self._events = collections.deque()
+        self._loop = None if callback else asyncio.get_event_loop()
+        self._waiter = None
+
+    def close(self):
+        """
+        Stops receiving events. Pending 'async for' loops end.
+        :return:
+        """
+        self.feed.unsubscribe(self)
+        self.closed = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> RowEvent:
+        while not self._events:
+            if self.closed:
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            await self._waiter
+        return self._events.popleft()
+
+    def _event(self, uuid: str, old: Dict, new: Dict):
+        was_matching = old is not None and self._matches(old)
+        is_matching = new is not None and self._matches(new)
+        if is_matching and not was_matching:
+            return RowEvent(INSERT, self.table, uuid, self._project(new), None)
+        if was_matching and not is_matching:
+            return RowEvent(DELETE, self.table, uuid, self._project(old), None)
+        if not is_matching:
+            return None
+        changed = {column: value for column, value in self._project(old).items()
+                   if new.get(column) != value}
+        if not changed:
+            return None
+        return RowEvent(MODIFY, self.table, uuid, self._project(new), changed)
+
+    def _project(self, row: Dict) -> Dict:
+        if self.columns is None:
+            return dict(row)
+        return {column: value for column, value in row.items()
+                if column in self.columns or column == "_uuid"}
+
+    def _push(self, events: List[RowEvent]):
+        self._events.extend(events)
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class ChangeFeed:
+    """
+    Fans out the changes of the tables of a replica to the subscriptions.
+    All the subscriptions share the monitors of the replica, and the
+    callbacks are called, in order, from a single thread so that slow
+    subscribers do not delay the monitors.
+    """
+
+    def __init__(self, replica: OvsdbReplica):
+        self.replica = replica
+        self._subscriptions = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        replica.add_listener(self._on_changes)
+
+    def subscribe(self, table: str, callback: Callable = None, columns: List[str] = None,
+                  where: List = None, initial: bool = False) -> Subscription:
+        """
+        Subscribes to the changes of a table. The table, or the columns
+        used by the subscription, are added to the replica if they are not
+        replicated yet.
+        :param table: the table
+        :param callback: function that receives each RowEvent. If not
+        present, the subscription is iterated with 'async for'
+        :param columns: the columns of interest (None for all of them)
+        :param where: the conditions the rows have to match
+        :param initial: deliver the rows currently matching the
+        conditions as inserts before any change
+        :return: Subscription
+        """
+        self.replica.add_tables({table: monitored_columns(columns, where)})
+        subscription = Subscription(self, table, callback, columns, where)
+        with self.replica.mutex:
+            self._subscriptions.setdefault(table, []).append(subscription)
+            if initial:
+                rows = self.replica.select(table, subscription.where)
+                self._dispatch(subscription, [subscription._event(row["_uuid"][1], None, row)
+                                              for row in rows])
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        Removes a subscription
+        :param subscription: the subscription
+        :return:
+        """
+        with self.replica.mutex:
+            subscriptions = self._subscriptions.get(subscription.table, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+
+    def close(self):
+        """
+        Closes all the subscriptions and stops the callback thread
+        :return:
+        """
+        self.replica.remove_listener(self._on_changes)
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def _on_changes(self, changes: List[Tuple]):
+        events = collections.OrderedDict()
+        for table, uuid, old, new in changes:
+            for subscription in self._subscriptions.get(table, []):
+                event = subscription._event(uuid, old, new)
+                if event is not None:
+                    events.setdefault(subscription, []).append(event)
+        for subscription, subscription_events in events.items():
+            self._dispatch(subscription, subscription_events)
+
+    def _dispatch(self, subscription: Subscription, events: List[RowEvent]):
+        if not events:
+            return
+        if subscription.callback is None:
+            subscription._push(events)
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._queue.put((subscription, events))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            subscription, events = item
+            for event in events:
+                if subscription.closed:
+                    break
+                try:
+                    subscription.callback(event)
+                except Exception:  # pylint: disable=broad-except
+                    LOGGER.exception("Error handling a change of table '%s'", subscription.table)
+
+
+def monitored_columns(columns: List[str] = None, where: List = None) -> List[str]:
+    """
+    Gets the columns a subscription needs from the replica
+    :param columns: the columns of interest (None for all of them)
+    :param where: the conditions the rows have to match
+    :return: the columns of interest plus the ones used by the
+    conditions, or None for all of them
+    """
+    if columns is None:
+        return None
+    needed = list(columns)
+    for column, _, _ in where or []:
+        if column not in needed:
+            needed.append(column)
+    return [column for column in needed if column not in ("_uuid", "_version")]
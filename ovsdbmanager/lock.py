@@ -0,0 +1,185 @@
+"""
+OvsdbLock - Class that handles an OVSDB lock (RFC 7047 section 4.1.8),
+used to coordinate several clients writing to the same database.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List
+
+from ovsdbmanager import operation
+from ovsdbmanager.exception import OvsdbQueryException
+from ovsdbmanager.query import OvsdbQuery
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OvsdbLock:
+    """
+    A lock owned by the session of a query with a dedicated connection.
+    Waiting for the lock does not poll the server: the request is queued
+    by the server, which notifies the client when it gets the lock.
+    The callbacks run on a thread of their own, so they can use the
+    query (whose responses are read by the connection thread).
+    """
+
+    def __init__(self, query: OvsdbQuery, name: str, on_acquired: Callable = None,
+                 on_lost: Callable = None):
+        """
+        :param query: query with a dedicated connection
+        :param name: the name of the lock
+        :param on_acquired: function called (without arguments) when the
+        lock is acquired after having been queued
+        :param on_lost: function called (without arguments) when the lock
+        is stolen by another client or the connection is lost
+        """
+        if query.connection is None:
+            raise OvsdbQueryException("Locks need a query with a dedicated connection")
+        self.query = query
+        self.name = name
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self._held = threading.Event()
+        self._requested = False
+        self._callbacks = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._register()
+
+    @property
+    def held(self) -> bool:
+        return self._held.is_set()
+
+    def acquire(self, blocking: bool = True, timeout: float = None,
+                steal: bool = False) -> bool:
+        """
+        Acquires the lock
+        :param blocking: whether to wait until the lock is acquired
+        :param timeout: maximum number of seconds to wait. If not present,
+        waits forever
+        :param steal: take the lock even if another client owns it
+        :return: whether the lock is held
+        """
+        # The "locked" notification may be handled right after the reply,
+        # before this method goes on
+        self._requested = True
+        try:
+            if steal:
+                response = self.query.steal(self.name)
+            else:
+                response = self.query.lock(self.name)
+        except Exception:
+            self._requested = False
+            raise
+        if response["result"].get("locked"):
+            self._held.set()
+        elif blocking:
+            self._held.wait(timeout)
+        return self.held
+
+    def resume(self):
+        """
+        Moves the lock to the new connection of the query, after the
+        previous one was lost. If the lock had been requested, it is
+        requested again.
+        :return:
+        """
+        self._register()
+        if not self._requested:
+            return
+        response = self.query.lock(self.name)
+        if response["result"].get("locked") and not self.held:
+            self._held.set()
+            self._call(self.on_acquired)
+
+    def release(self):
+        """
+        Releases the lock, or cancels the pending request to acquire it
+        :return:
+        """
+        self._requested = False
+        self._held.clear()
+        self.query.unlock(self.name)
+
+    def transact(self, ops: List) -> Dict:
+        """
+        Sends a transaction that is only committed if the lock is still
+        held. OvsdbNotOwner is raised otherwise.
+        :param ops: the list of operations
+        :return: the response to the transaction, without the result of
+        the assert operation
+        """
+        if self.query.lock_name == self.name and any(op["op"] != "select" for op in ops):
+            # The query already guards its write transactions with this lock
+            return self.query.multiple_ops(ops)
+        response = self.query.multiple_ops([operation.assert_lock(self.name)] + list(ops))
+        response["result"] = response["result"][1:]
+        return response
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def _register(self):
+        self.query.connection.add_handler("locked", self._on_locked)
+        self.query.connection.add_handler("stolen", self._on_stolen)
+        self.query.connection.add_close_handler(self._on_close)
+
+    def _on_locked(self, params: List):
+        if params[0] != self.name or not self._requested:
+            return
+        self._held.set()
+        self._call(self.on_acquired)
+
+    def _on_stolen(self, params: List):
+        if params[0] != self.name:
+            return
+        self._lost()
+
+    def _on_close(self, _error):
+        if self._requested:
+            self._lost()
+
+    def _lost(self):
+        was_held = self.held
+        self._held.clear()
+        if was_held:
+            self._call(self.on_lost)
+
+    def _call(self, callback: Callable):
+        if callback is None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._callbacks.put(callback)
+
+    def _run(self):
+        while True:
+            callback = self._callbacks.get()
+            try:
+                callback()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Error in a callback of lock '%s'", self.name)
@@ -67,6 +67,78 @@ def transact(db: str, operations: List) -> Dict:
     }
 
 
+def monitor_cond_since(db: str, monitor_id: str, requests: Dict,
+                       last_txn_id: str = None) -> Dict:
+    """
+    Builds the request payload to monitor a set of tables, receiving only
+    the changes done after a given transaction if the server still has them
+    :param db: the database
+    :param monitor_id: the id that will be used in the update notifications
+    :param requests: the monitored columns, as a dict keyed by table name
+    :param last_txn_id: the id of the last transaction already known by the
+    client. If not present the whole content of the tables is sent
+    :return: the request payload
+    """
+    return {
+        "method": "monitor_cond_since",
+        "params": [db, monitor_id, requests,
+                   last_txn_id or "00000000-0000-0000-0000-000000000000"],
+        "id": generate_uuid()
+    }
+
+
+def monitor_cancel(monitor_id: str) -> Dict:
+    """
+    Builds the request payload to cancel a monitor
+    :param monitor_id: the id of the monitor
+    :return: the request payload
+    """
+    return {
+        "method": "monitor_cancel",
+        "params": [monitor_id],
+        "id": generate_uuid()
+    }
+
+
+def lock(lock_id: str) -> Dict:
+    """
+    Builds the request payload to acquire a lock. If the lock is owned by
+    another client, the request is queued and a "locked" notification is
+    sent when it is acquired
+    :param lock_id: the name of the lock
+    :return: the request payload
+    """
+    return _lock_method("lock", lock_id)
+
+
+def steal(lock_id: str) -> Dict:
+    """
+    Builds the request payload to acquire a lock immediately, even if it
+    is owned by another client (which receives a "stolen" notification)
+    :param lock_id: the name of the lock
+    :return: the request payload
+    """
+    return _lock_method("steal", lock_id)
+
+
+def unlock(lock_id: str) -> Dict:
+    """
+    Builds the request payload to release a lock (or cancel a pending
+    lock request)
+    :param lock_id: the name of the lock
+    :return: the request payload
+    """
+    return _lock_method("unlock", lock_id)
+
+
+def _lock_method(method: str, lock_id: str) -> Dict:
+    return {
+        "method": method,
+        "params": [lock_id],
+        "id": generate_uuid()
+    }
+
+
 def echo(params: List = None, query_id: str = None) -> Dict:
     """
     Builds the response payload to reply to an echo request. This is a
@@ -80,3 +152,18 @@ def echo(params: List = None, query_id: str = None) -> Dict:
         "params": params or ["1", "2", "3"],
         "id": query_id or generate_uuid()
     }
+
+
+def echo_reply(params: List, query_id) -> Dict:
+    """
+    Builds the response payload to reply to an echo request sent by the
+    server
+    :param params: the set of params sent in the echo request
+    :param query_id: the id sent in the echo request
+    :return: the response payload
+    """
+    return {
+        "result": params,
+        "error": None,
+        "id": query_id
+    }
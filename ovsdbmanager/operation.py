@@ -86,6 +86,46 @@ def update(table: str, row: Dict, where: List = None) -> Dict:
     }
 
 
+def mutate(table: str, mutations: List, where: List = None) -> Dict:
+    """
+    Builds a mutate operation (in-place update)
+    :param table: The table where the element(s) are
+    :param mutations: list of [<column>, <mutator>, <value>] mutations,
+    e.g. ["ports", "insert", ["set", [port_uuid]]]
+    :param where: the conditions to filter the table. If not present,
+    all the elements of the table are mutated
+    :return: the operation payload
+    """
+    if where is None:
+        where = []
+    return {
+        "op": "mutate",
+        "table": table,
+        "where": where,
+        "mutations": mutations
+    }
+
+
+def update_keys(table: str, column: str, keys: Dict, where: List = None) -> Dict:
+    """
+    Builds a mutate operation that sets or deletes some keys of a map
+    column (e.g. external_ids), leaving the rest of the map untouched
+    :param table: The table where the element(s) are
+    :param column: the map column
+    :param keys: the keys to set, with their values. The keys whose value
+    is None are deleted
+    :param where: the conditions to filter the table
+    :return: the operation payload
+    """
+    # Inserting a key that already exists does not change its value, so
+    # the keys are deleted first
+    mutations = [[column, "delete", ["set", list(keys)]]]
+    pairs = [[key, value] for key, value in keys.items() if value is not None]
+    if pairs:
+        mutations.append([column, "insert", ["map", pairs]])
+    return mutate(table, mutations, where)
+
+
 def delete(table: str, where: List = None) -> Dict:
     """
     Builds a delete operation (delete)
@@ -100,3 +140,44 @@ def delete(table: str, where: List = None) -> Dict:
         "table": table,
         "where": where
     }
+
+
+def wait(table: str, where: List, columns: List, rows: List, until: str = "==",
+         timeout: int = 0) -> Dict:
+    """
+    Builds a wait operation (precondition)
+    :param table: The table where the element(s) are
+    :param where: The condition to filter the table
+    :param columns: The columns that have to be compared
+    :param rows: The expected value of 'columns' for the rows matching
+    'where'
+    :param until: "==" to wait until the rows are equal to 'rows', "!="
+    to wait until they are different
+    :param timeout: milliseconds to wait for the condition. With 0 the
+    transaction fails right away if the condition is not met
+    :return: the operation payload
+    """
+    if until not in ["==", "!="]:
+        raise TypeError("Unsupported until function")
+    return {
+        "op": "wait",
+        "table": table,
+        "where": where,
+        "columns": columns,
+        "until": until,
+        "rows": rows,
+        "timeout": timeout
+    }
+
+
+def assert_lock(lock: str) -> Dict:
+    """
+    Builds an assert operation, which makes the transaction fail if the
+    client does not own the lock
+    :param lock: the name of the lock
+    :return: the operation payload
+    """
+    return {
+        "op": "assert",
+        "lock": lock
+    }
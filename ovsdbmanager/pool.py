@@ -0,0 +1,140 @@
+"""
+OvsdbConnectionPool - Pool of persistent connections to an OVSDB server
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from ovsdbmanager import method
+from ovsdbmanager.connection import OvsdbConnection, PROBE_INTERVAL, TIMEOUT
+from ovsdbmanager.exception import OvsdbPoolExhausted
+
+POOL_SIZE = 8
+IDLE_TIMEOUT = 60.
+CHECK_INTERVAL = 5.
+
+
+class OvsdbConnectionPool:
+    """
+    Bounded pool of persistent connections to a single OVSDB server that
+    can be shared by several threads (and several OvsdbManager objects).
+    Connections that have been idle for a while are checked with an echo
+    request before being handed out, and the ones idle for longer than
+    'idle_timeout' are closed.
+    """
+
+    def __init__(self, ip: str = "127.0.0.1", port: int = 6640, size: int = POOL_SIZE,
+                 acquire_timeout: float = TIMEOUT, idle_timeout: float = IDLE_TIMEOUT,
+                 check_interval: float = CHECK_INTERVAL, timeout: float = TIMEOUT,
+                 probe_interval: float = PROBE_INTERVAL):
+        self.ip = ip
+        self.port = port
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.probe_interval = probe_interval
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that acquires a connection and gives it back to the
+        pool when done
+        :return: OvsdbConnection
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def acquire(self, timeout: float = None) -> OvsdbConnection:
+        """
+        Gets a healthy connection from the pool, opening a new one if there
+        are no idle connections
+        :param timeout: seconds to wait for a free connection. If not
+        present, 'acquire_timeout' is used
+        :return: OvsdbConnection
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise OvsdbPoolExhausted("No connection available to {}:{} after {}s".format(
+                self.ip, self.port, timeout))
+        try:
+            while True:
+                conn = self._pop_idle()
+                if conn is None:
+                    return OvsdbConnection(self.ip, self.port, self.timeout,
+                                           self.probe_interval)
+                if self._is_healthy(conn):
+                    return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: OvsdbConnection):
+        """
+        Gives a connection back to the pool
+        :param conn: the connection acquired with 'acquire'
+        :return:
+        """
+        with self._lock:
+            if not conn.closed:
+                self._idle.append(conn)
+        self._slots.release()
+        self._evict_idle()
+
+    def close(self):
+        """
+        Closes all the idle connections of the pool
+        :return:
+        """
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+    def _pop_idle(self):
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def _is_healthy(self, conn: OvsdbConnection) -> bool:
+        idle = time.monotonic() - conn.last_used
+        if conn.closed or idle > self.idle_timeout:
+            conn.close()
+            return False
+        if idle > self.check_interval:
+            try:
+                request = method.echo()
+                return conn.call(request)["result"] == request["params"]
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle and now - self._idle[0].last_used > self.idle_timeout:
+                self._idle.popleft().close()
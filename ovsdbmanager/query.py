@@ -19,57 +19,173 @@ OvsdbQuery - Class responsible for sending the queries
      Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
 """
 
+import contextlib
 import json
 import socket
+import time
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Callable, Dict, List
 
 from ovsdbmanager import method, operation, exception
+from ovsdbmanager.cluster import OvsdbCluster
+from ovsdbmanager.connection import OvsdbConnection
+from ovsdbmanager.pool import OvsdbConnectionPool
+from ovsdbmanager.recorder import TrafficRecorder
+from ovsdbmanager.schema import OvsdbSchema, parse_schema, validate_ops
+from ovsdbmanager.utils import jittered_backoff
 
 TIMEOUT = 5
 BUFSIZE = 1024
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 1.
 
 
 class OvsdbQuery:
     """
-    Contains the set of queries that can be made to an OVSDB server
+    Contains the set of queries that can be made to an OVSDB server.
+    If a connection pool is given, the queries are sent through its
+    persistent connections. Otherwise a new socket is opened for each one.
+    If a connection is given, all the queries are sent through it instead,
+    which is needed for the requests bound to a session (e.g. locks).
+    If a cluster is given, the queries are sent to its leader or to its
+    followers depending on whether they write to the database.
+    If validate is set, the operations are checked against the schema of
+    the database (fetched once and cached) before being sent.
+    If a record path is given, all the requests and responses are logged
+    to that file (see the recorder module).
     """
 
-    def __init__(self, ip: str, port: int, db):
+    def __init__(self, ip: str, port: int, db, pool: OvsdbConnectionPool = None,
+                 record: str = None, connection: OvsdbConnection = None,
+                 cluster: OvsdbCluster = None, validate: bool = False):
         self.db = db
         self.ip = ip
         self.port = port
+        self.pool = pool
+        self.connection = connection
+        self.cluster = cluster
+        self.validate = validate
+        self._schemas = {}
+        self.recorder = TrafficRecorder(record) if record else None
+        self.lock_name = None
 
     def echo_request(self) -> Dict:
         return self._send(method.echo())
 
-    def echo_reply(self, params, query_id):
-        """
-        Sends an echo reply message
-        :param params: the params sent by the echo request
-        :param query_id: the id sent by the echo request
-        :return: the response to the message
-        """
-        return self._send(method.echo(params, query_id))
-
     def list_dbs(self) -> Dict:
         return self._send(method.list_dbs())
 
     def get_schema(self, db) -> Dict:
         return self._send(method.get_schema(db))
 
+    def schema(self, db: str = None) -> OvsdbSchema:
+        """
+        Gets the schema of a database. It is only requested to the server
+        the first time.
+        :param db: the database. If not present, the database of the query
+        :return: OvsdbSchema
+        """
+        db = db or self.db
+        if db not in self._schemas:
+            self._schemas[db] = parse_schema(self.get_schema(db)["result"])
+        return self._schemas[db]
+
+    def invalidate_schema(self):
+        """
+        Forgets the cached schemas, e.g. after the database is upgraded
+        :return:
+        """
+        self._schemas = {}
+
+    def lock(self, lock_id: str) -> Dict:
+        return self._send_session(method.lock(lock_id))
+
+    def steal(self, lock_id: str) -> Dict:
+        return self._send_session(method.steal(lock_id))
+
+    def unlock(self, lock_id: str) -> Dict:
+        return self._send_session(method.unlock(lock_id))
+
     def select_from_table(self, table_name, where=None) -> Dict:
-        body = method.transact(self.db, [operation.select(table_name, where)])
-        return _check_response(self._send(body))
+        return self.multiple_ops([operation.select(table_name, where)])
 
     def update_table(self, table_name, row, where=None) -> Dict:
-        body = method.transact(self.db, [operation.update(table_name, row, where)])
-        return _check_response(self._send(body))
+        return self.multiple_ops([operation.update(table_name, row, where)])
 
     def multiple_ops(self, ops) -> Dict:
-        return _check_response(self._send(method.transact(self.db, ops)), len(ops))
+        """
+        Sends a transaction. If 'lock_name' is set, the write transactions
+        are guarded by an assert operation on that lock, whose result is
+        removed from the response.
+        :param ops: the list of operations
+        :return: the response to the transaction
+        """
+        if self.validate:
+            validate_ops(self.schema(), ops)
+        if self.lock_name is None or all(op["op"] == "select" for op in ops):
+            return _check_response(self._send(method.transact(self.db, ops)))
+        ops = [operation.assert_lock(self.lock_name)] + list(ops)
+        response = _check_response(self._send(method.transact(self.db, ops)))
+        response["result"] = response["result"][1:]
+        return response
+
+    def transact_with_retry(self, build_ops: Callable[[], List],
+                            retries: int = MAX_RETRIES) -> Dict:
+        """
+        Runs an optimistic read-modify-write transaction. 'build_ops' reads
+        the current state and returns the operations to be sent, guarded
+        by 'wait' operations on the columns it has read. If another client
+        modifies them in the meantime the transaction is rebuilt and sent
+        again after a jittered backoff.
+        :param build_ops: callable that returns the list of operations
+        :param retries: maximum number of retries
+        :return: the response to the transaction
+        """
+        attempt = 0
+        while True:
+            try:
+                with self._leader_reads():
+                    return self.multiple_ops(build_ops())
+            except exception.OvsdbPreconditionFailed:
+                if attempt >= retries:
+                    raise
+                time.sleep(jittered_backoff(attempt, BACKOFF_BASE, BACKOFF_MAX))
+                attempt += 1
+
+    def _leader_reads(self):
+        # The reads of a read-modify-write transaction are done on the
+        # leader of a cluster, followers could return an old state
+        if self.cluster is None:
+            return contextlib.ExitStack()
+        return self.cluster.leader_reads()
 
     def _send(self, query: Dict):
+        if self.recorder is None:
+            return self._send_query(query)
+        self.recorder.request(query)
+        response = self._send_query(query)
+        self.recorder.response(response)
+        return response
+
+    def _send_session(self, query: Dict) -> Dict:
+        if self.connection is None:
+            raise exception.OvsdbQueryException(
+                "'{}' needs a query with a dedicated connection".format(query["method"]))
+        response = self._send(query)
+        if response.get("error"):
+            raise exception.OvsdbQueryException(response["error"])
+        return response
+
+    def _send_query(self, query: Dict):
+        if self.connection is not None:
+            return self.connection.call(query)
+        if self.cluster is not None:
+            return self.cluster.send(query)
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                return conn.call(query)
+
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(5.)
         s.connect((self.ip, self.port))
@@ -86,9 +202,9 @@ class OvsdbQuery:
                 query_response = json.loads(buf.decode())
 
                 if "method" in query_response.keys() and query_response["method"] == "echo":
-                    echo_reply = self.echo_reply(query_response["params"],
-                                                 query_response["id"])
-                    s.send(json.loads(echo_reply).encode())
+                    echo_reply = method.echo_reply(query_response["params"],
+                                                   query_response["id"])
+                    s.send(json.dumps(echo_reply).encode())
                     buf = bytes()
                 else:
                     s.close()
@@ -99,13 +215,21 @@ class OvsdbQuery:
         raise TimeoutError("Connection timed out")
 
 
-def _check_response(response: Dict, num_ops: int = 1) -> Dict:
-    if len(response["result"]) == num_ops:
+def _check_response(response: Dict) -> Dict:
+    if response.get("error"):
+        raise exception.OvsdbQueryException(response["error"])
+
+    errors = [result for result in response["result"] if result and "error" in result]
+    if not errors:
         return response
 
-    result_error = response["result"][num_ops]
+    result_error = errors[0]
     error_type = result_error["error"]
-    error_details = result_error["details"]
+    error_details = result_error.get("details", error_type)
+    if error_type == "timed out":
+        raise exception.OvsdbPreconditionFailed(error_details)
+    if error_type == "not owner":
+        raise exception.OvsdbNotOwner(error_details)
     if error_type == "referential integrity violation":
         raise exception.OvsdbReferentialIntegrityViolation(error_details)
     if error_type == "constraint violation":
@@ -0,0 +1,98 @@
+"""
+TrafficRecorder - Class that logs the JSON-RPC requests and responses
+exchanged with an OVSDB server.
+
+Each line of the log is a compact JSON object with the time the message
+was sent or received ("t"), its direction ("req" or "resp"), its size
+in bytes ("size") and the message itself ("msg"). Logs whose name ends
+with ".gz" are compressed.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import gzip
+import json
+import threading
+import time
+from typing import Dict, Iterator
+
+REQUEST = "req"
+RESPONSE = "resp"
+
+
+class TrafficRecorder:
+    """
+    Appends the messages exchanged with the server to a log file. It can
+    be shared by several threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open(path, "at")
+        self._lock = threading.Lock()
+
+    def request(self, message: Dict):
+        """
+        Logs a request sent to the server
+        :param message: the request payload
+        :return:
+        """
+        self._write(REQUEST, message)
+
+    def response(self, message: Dict):
+        """
+        Logs a response received from the server
+        :param message: the response payload
+        :return:
+        """
+        self._write(RESPONSE, message)
+
+    def close(self):
+        """
+        Closes the log file
+        :return:
+        """
+        with self._lock:
+            self._file.close()
+
+    def _write(self, direction: str, message: Dict):
+        timestamp = time.time()
+        encoded = json.dumps(message, separators=(",", ":"))
+        line = '{{"t":{:.6f},"dir":"{}","size":{},"msg":{}}}\n'.format(
+            timestamp, direction, len(encoded.encode()), encoded)
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+def read_log(path: str) -> Iterator[Dict]:
+    """
+    Reads a log written by TrafficRecorder
+    :param path: the path of the log
+    :return: iterator over the logged entries
+    """
+    with _open(path, "rt") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
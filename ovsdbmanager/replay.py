@@ -0,0 +1,143 @@
+"""
+Replays a JSON-RPC log recorded with TrafficRecorder against an OVSDB
+server, either keeping the original timing of the requests or as fast as
+possible, and prints a summary of the latencies observed.
+
+The server should hold a copy of the database the log was recorded
+against, otherwise the transactions referring to existing rows fail.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from ovsdbmanager.pool import OvsdbConnectionPool
+from ovsdbmanager.recorder import read_log, REQUEST, RESPONSE
+from ovsdbmanager.utils import generate_uuid
+
+WORKERS = 8
+
+
+def load_requests(path: str) -> List[Dict]:
+    """
+    Loads the requests of a log, with their offset from the first request
+    and the latency observed when they were recorded
+    :param path: the path of the log
+    :return: list of dicts with the "offset", "latency" and "msg" keys
+    """
+    requests = []
+    sent = {}
+    start = None
+    for entry in read_log(path):
+        if entry["dir"] == REQUEST:
+            start = entry["t"] if start is None else start
+            request = {"offset": entry["t"] - start, "latency": None, "msg": entry["msg"]}
+            sent[entry["msg"]["id"]] = (entry["t"], request)
+            requests.append(request)
+        elif entry["dir"] == RESPONSE and entry["msg"].get("id") in sent:
+            sent_at, request = sent.pop(entry["msg"]["id"])
+            request["latency"] = entry["t"] - sent_at
+    return requests
+
+
+def replay(requests: List[Dict], pool: OvsdbConnectionPool, speed: float = 1.,
+           workers: int = WORKERS) -> List[Dict]:
+    """
+    Sends the requests to the server
+    :param requests: the requests, as returned by load_requests
+    :param pool: the pool of connections to the server
+    :param speed: speed factor applied to the original timing. With 0 the
+    requests are sent as fast as possible
+    :param workers: maximum number of requests in flight
+    :return: list of dicts with the "latency" and "error" of each request
+    """
+    start = time.monotonic()
+    with ThreadPoolExecutor(workers) as executor:
+        futures = []
+        for request in requests:
+            if speed:
+                delay = start + request["offset"] / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(_send, pool, request["msg"]))
+        return [future.result() for future in futures]
+
+
+def _send(pool: OvsdbConnectionPool, message: Dict) -> Dict:
+    message = dict(message, id=generate_uuid())
+    sent_at = time.monotonic()
+    try:
+        with pool.connection() as conn:
+            response = conn.call(message)
+    except (OSError, ValueError) as e:
+        return {"latency": time.monotonic() - sent_at, "error": repr(e)}
+    return {"latency": time.monotonic() - sent_at, "error": _find_error(response)}
+
+
+def _find_error(response: Dict):
+    if response.get("error"):
+        return response["error"]
+    if isinstance(response.get("result"), list):
+        for result in response["result"]:
+            if isinstance(result, dict) and "error" in result:
+                return result["error"]
+    return None
+
+
+def _percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    last = len(values) - 1
+    return " ".join("p{}={:.2f}ms".format(p, values[min(last, int(len(values) * p / 100))] * 1000)
+                    for p in (50, 95, 99))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Replay a recorded OVSDB JSON-RPC log")
+    parser.add_argument("log", help="log recorded with OvsdbQuery(record=...)")
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6640)
+    parser.add_argument("--speed", type=float, default=1.,
+                        help="speed factor over the original timing, 0 for as fast as possible")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="maximum number of requests in flight")
+    args = parser.parse_args(argv)
+
+    requests = load_requests(args.log)
+    pool = OvsdbConnectionPool(args.ip, args.port, size=args.workers)
+    start = time.monotonic()
+    results = replay(requests, pool, args.speed, args.workers)
+    elapsed = time.monotonic() - start
+    pool.close()
+
+    errors = [result["error"] for result in results if result["error"]]
+    print("requests: {}  errors: {}  elapsed: {:.3f}s  rate: {:.1f} req/s".format(
+        len(results), len(errors), elapsed, len(results) / elapsed if elapsed else 0))
+    print("recorded latency: {}".format(_percentiles(
+        [request["latency"] for request in requests if request["latency"] is not None])))
+    print("replayed latency: {}".format(_percentiles([result["latency"] for result in results])))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
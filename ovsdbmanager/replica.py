@@ -0,0 +1,370 @@
+"""
+OvsdbReplica - In-memory copy of a set of tables kept up to date with the
+changes notified by the server.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from ovsdbmanager import method
+from ovsdbmanager.condition import ColumnIndex, filter_rows
+from ovsdbmanager.connection import OvsdbConnection
+from ovsdbmanager.exception import OvsdbQueryException
+from ovsdbmanager.schema import ColumnType, parse_schema
+from ovsdbmanager.snapshot import load_snapshot, save_snapshot
+from ovsdbmanager.utils import generate_uuid, parse_set
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OvsdbReplica:
+    """
+    Keeps a copy of some tables of the database using monitor_cond_since
+    sessions. If a snapshot file is given, the rows saved in it are
+    loaded first and only the changes done since the snapshot was taken
+    are requested to the server.
+    """
+
+    def __init__(self, connection: OvsdbConnection, db: str = "Open_vSwitch",
+                 tables: Dict[str, List] = None, snapshot: str = None):
+        """
+        :param connection: persistent connection used for the monitors
+        :param db: the database
+        :param tables: the monitored tables, with the list of monitored
+        columns of each one (None to monitor all of them)
+        :param snapshot: path of a snapshot file to start from
+        """
+        self.db = db
+        self.columns = tables or {"Open_vSwitch": None}
+        self.tables = {table: {} for table in self.columns}
+        self.connection = None
+        # The tables of each monitor and the id of the last transaction
+        # it has applied. Tables added later get monitors of their own, so
+        # the ones already replicated are not requested again.
+        self._monitors = {generate_uuid(): list(self.columns)}
+        self._last_txn_ids = {monitor_id: None for monitor_id in self._monitors}
+        self._indexes = {table: {} for table in self.columns}
+        self._lock = threading.RLock()
+        self._monitor_lock = threading.Lock()
+        self._schema = None
+        self._listeners = []
+        self._pending = {}
+        if snapshot and os.path.exists(snapshot):
+            self._load_snapshot(snapshot)
+        self.resume(connection)
+
+    def resume(self, connection: OvsdbConnection):
+        """
+        Starts (or restarts, e.g. after a reconnection) monitoring the
+        tables on a connection. Only the changes since the last known
+        transaction are requested.
+        :param connection: persistent connection used for the monitors
+        :return:
+        """
+        if self._schema is None:
+            self._schema = parse_schema(connection.call(method.get_schema(self.db))["result"])
+        with self._monitor_lock:
+            if connection is not self.connection:
+                connection.add_handler("update3", self._on_update3)
+            with self._lock:
+                self.connection = connection
+                monitors = list(self._monitors.items())
+            for monitor_id, tables in monitors:
+                self._monitor(monitor_id, tables, self._last_txn_ids[monitor_id])
+
+    def add_tables(self, tables: Dict[str, List]):
+        """
+        Adds tables, or columns of the replicated tables, to the replica.
+        The new tables get a monitor of their own, while the monitor of a
+        table getting new columns is replaced by a new one. The listeners
+        get the rows that changed while switching, but not the contents of
+        the new tables.
+        :param tables: the tables, with the list of columns of each one
+        (None for all of them)
+        :return:
+        """
+        with self._monitor_lock:
+            with self._lock:
+                columns = self._merge_columns(tables)
+                changed = [table for table in columns
+                           if table not in self.columns or columns[table] != self.columns[table]]
+                if not changed:
+                    return
+                # Updates of the replaced monitors are ignored from now on
+                replaced = {monitor_id: monitor_tables
+                            for monitor_id, monitor_tables in self._monitors.items()
+                            if any(table in changed for table in monitor_tables)}
+                for monitor_id in replaced:
+                    del self._monitors[monitor_id]
+                old_columns, self.columns = self.columns, columns
+                for table in columns:
+                    self._indexes.setdefault(table, {})
+            monitor_tables = changed + [table for monitor_tables in replaced.values()
+                                        for table in monitor_tables if table not in changed]
+            try:
+                self._monitor(generate_uuid(), monitor_tables)
+            except Exception:
+                with self._lock:
+                    self.columns = old_columns
+                    self._monitors.update(replaced)
+                raise
+            for monitor_id in replaced:
+                del self._last_txn_ids[monitor_id]
+                self.connection.call(method.monitor_cancel(monitor_id))
+
+    def _merge_columns(self, tables: Dict[str, List]) -> Dict[str, List]:
+        columns = dict(self.columns)
+        for table, table_columns in tables.items():
+            if table not in columns or table_columns is None:
+                columns[table] = table_columns
+            elif columns[table] is not None:
+                columns[table] = columns[table] + [column for column in table_columns
+                                                   if column not in columns[table]]
+        return columns
+
+    def _monitor(self, monitor_id: str, tables: List[str], last_txn_id: str = None):
+        # The updates of the monitor are kept until its initial contents
+        # have been loaded, without holding the mutex while waiting for
+        # them
+        with self._lock:
+            self._pending[monitor_id] = []
+        try:
+            response = self.connection.call(method.monitor_cond_since(
+                self.db, monitor_id, _requests({table: self.columns[table] for table in tables}),
+                last_txn_id))
+            if response.get("error"):
+                raise OvsdbQueryException(response["error"])
+        except Exception:
+            with self._lock:
+                del self._pending[monitor_id]
+            raise
+        with self._lock:
+            pending = self._pending.pop(monitor_id)
+            found, last_txn_id, updates = response["result"]
+            changes = self._apply(updates) if found else self._reset(updates, tables)
+            for _, last_txn_id, updates in pending:
+                changes += self._apply(updates)
+            self._monitors[monitor_id] = tables
+            self._last_txn_ids[monitor_id] = last_txn_id
+            self._notify(changes)
+
+    def add_listener(self, listener: Callable):
+        """
+        Registers a function that is called, with the mutex held, after
+        every change of the replicated tables
+        :param listener: function that receives a list of (table, uuid,
+        old row, new row) tuples. The old row is None for inserted rows
+        and the new row is None for deleted ones
+        :return:
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        """
+        Unregisters a function registered with add_listener
+        :param listener: the function
+        :return:
+        """
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    @property
+    def mutex(self) -> threading.RLock:
+        """
+        Lock held while the replicated tables are changed and the
+        listeners are called
+        """
+        return self._lock
+
+    def select(self, table: str, where: List = None) -> List[Dict]:
+        """
+        Gets the rows of a replicated table matching the conditions
+        :param table: the table
+        :param where: the conditions, as used in operation.select
+        :return: the list of rows
+        """
+        with self._lock:
+            return filter_rows(self.tables[table], where or [], self._indexes[table])
+
+    def add_index(self, table: str, column: str):
+        """
+        Indexes a column of a replicated table, to speed up the selects
+        with '==' and 'includes' conditions on it
+        :param table: the table
+        :param column: the column
+        :return:
+        """
+        with self._lock:
+            self._indexes[table][column] = ColumnIndex(column, self.tables[table])
+
+    def save_snapshot(self, path: str):
+        """
+        Saves the replicated tables to a file
+        :param path: the path of the file
+        :return:
+        """
+        with self._lock:
+            last_txn_ids = {table: self._last_txn_ids[monitor_id]
+                            for monitor_id, tables in self._monitors.items() for table in tables}
+            save_snapshot(path, self.db, last_txn_ids, self.tables, self.columns)
+
+    def _load_snapshot(self, path: str):
+        db, last_txn_id, columns, tables = load_snapshot(path, list(self.columns))
+        if db != self.db or set(tables) != set(self.columns):
+            return
+        # Only the changes are requested for the loaded rows, so columns
+        # missing from the snapshot would never be filled
+        if columns is None or any(_column_set(columns[table]) != _column_set(self.columns[table])
+                                  for table in tables):
+            return
+        if not isinstance(last_txn_id, dict):
+            last_txn_id = {table: last_txn_id for table in tables}
+        # The tables that were at the same transaction share a monitor
+        monitors = {}
+        for table in tables:
+            monitors.setdefault(last_txn_id.get(table), []).append(table)
+        self.tables = tables
+        self._monitors = {generate_uuid(): monitor_tables for monitor_tables in monitors.values()}
+        self._last_txn_ids = {monitor_id: last_txn_id.get(monitor_tables[0])
+                              for monitor_id, monitor_tables in self._monitors.items()}
+
+    def _clear(self, tables: List[str]):
+        for table in tables:
+            self.tables[table] = {}
+            for column in self._indexes[table]:
+                self._indexes[table][column] = ColumnIndex(column)
+
+    def _on_update3(self, params: List):
+        monitor_id, last_txn_id, updates = params
+        with self._lock:
+            if monitor_id in self._pending:
+                self._pending[monitor_id].append(params)
+                return
+            if monitor_id not in self._monitors:
+                return
+            changes = self._apply(updates)
+            self._last_txn_ids[monitor_id] = last_txn_id
+            self._notify(changes)
+
+    def _apply(self, updates: Dict) -> List[Tuple]:
+        changes = []
+        for table, rows in updates.items():
+            for uuid, row_update in rows.items():
+                old = self.tables[table].get(uuid)
+                new = self._apply_row(table, uuid, old, row_update)
+                if old is not None:
+                    del self.tables[table][uuid]
+                    self._unindex(table, uuid, old)
+                if new is not None:
+                    self.tables[table][uuid] = new
+                    self._index(table, uuid, new)
+                changes.append((table, uuid, old, new))
+        return changes
+
+    def _reset(self, updates: Dict, tables: List[str]) -> List[Tuple]:
+        # The server sent the whole contents of the tables: compare them
+        # with the previous ones so that the listeners only get the rows
+        # that really changed. Tables that were not replicated before are
+        # not changes either.
+        old_tables = {table: self.tables[table] for table in tables if table in self.tables}
+        self._clear(tables)
+        self._apply(updates)
+        changes = []
+        for table, old_rows in old_tables.items():
+            new_rows = self.tables[table]
+            for uuid in set(old_rows) | set(new_rows):
+                old, new = old_rows.get(uuid), new_rows.get(uuid)
+                # Columns that were not replicated before are not changes
+                if old is None or new is None or \
+                        any(new.get(column) != value for column, value in old.items()):
+                    changes.append((table, uuid, old, new))
+        return changes
+
+    def _notify(self, changes: List[Tuple]):
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Error notifying the changes of the replica")
+
+    def _apply_row(self, table: str, uuid: str, old: Dict, row_update: Dict):
+        if "delete" in row_update:
+            return None
+        if "modify" in row_update:
+            new = dict(old)
+            for column, diff in row_update["modify"].items():
+                column_type = self._schema.column_type(table, column)
+                new[column] = _apply_diff(column_type, old.get(column, column_type.default()),
+                                          diff)
+            return new
+        content = row_update.get("initial", row_update.get("insert"))
+        new = {column: column_type.default()
+               for column, column_type in self._schema.tables[table].items()
+               if self.columns[table] is None or column in self.columns[table]}
+        new.update(content)
+        new["_uuid"] = ["uuid", uuid]
+        return new
+
+    def _index(self, table: str, uuid: str, row: Dict):
+        for index in self._indexes[table].values():
+            index.add(uuid, row)
+
+    def _unindex(self, table: str, uuid: str, row: Dict):
+        for index in self._indexes[table].values():
+            index.remove(uuid, row)
+
+
+def _column_set(columns: List):
+    return None if columns is None else set(columns)
+
+
+def _requests(columns: Dict[str, List]) -> Dict:
+    return {table: {"columns": table_columns} if table_columns else {}
+            for table, table_columns in columns.items()}
+
+
+def _apply_diff(column_type: ColumnType, old, diff):
+    if column_type.is_map:
+        pairs = {_hashable(key): [key, value] for key, value in old[1]}
+        for key, value in diff[1]:
+            current = pairs.get(_hashable(key))
+            if current is not None and current[1] == value:
+                del pairs[_hashable(key)]
+            else:
+                pairs[_hashable(key)] = [key, value]
+        return ["map", list(pairs.values())]
+    if column_type.is_set:
+        elements = {_hashable(element): element for element in parse_set(old)}
+        for element in parse_set(diff):
+            if elements.pop(_hashable(element), None) is None:
+                elements[_hashable(element)] = element
+        elements = list(elements.values())
+        return elements[0] if len(elements) == 1 else ["set", elements]
+    return diff
+
+
+def _hashable(atom):
+    return tuple(atom) if isinstance(atom, list) else atom
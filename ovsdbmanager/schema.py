@@ -0,0 +1,298 @@
+"""
+OvsdbSchema - Parsed database schema (RFC 7047 section 3.2), used to
+validate the operations before sending them to the server.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import json
+import threading
+from typing import Dict, List
+
+from ovsdbmanager.exception import OvsdbSchemaViolation
+
+DEFAULT_ATOMS = {
+    "integer": 0,
+    "real": 0.0,
+    "boolean": False,
+    "string": "",
+    "uuid": ["uuid", "00000000-0000-0000-0000-000000000000"]
+}
+SYSTEM_COLUMNS = ["_uuid", "_version"]
+MUTATORS = {
+    "integer": ["+=", "-=", "*=", "/=", "%="],
+    "real": ["+=", "-=", "*=", "/="],
+}
+
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+
+class BaseType:
+    """
+    Type of the keys or the values of a column, with its constraints
+    """
+
+    def __init__(self, base_type):
+        if not isinstance(base_type, dict):
+            base_type = {"type": base_type}
+        self.type = base_type["type"]
+        enum = base_type.get("enum")
+        if isinstance(enum, list) and enum and enum[0] == "set":
+            enum = enum[1]
+        elif enum is not None:
+            enum = [enum]
+        self.enum = enum
+        self.min = base_type.get("minInteger", base_type.get("minReal"))
+        self.max = base_type.get("maxInteger", base_type.get("maxReal"))
+        self.min_length = base_type.get("minLength")
+        self.max_length = base_type.get("maxLength")
+        self.ref_table = base_type.get("refTable")
+
+    def validate(self, atom, where: str):
+        """
+        Checks that an atom belongs to this type
+        :param atom: the atom
+        :param where: description of the atom, used in the error message
+        :return:
+        """
+        if not _is_atom(self.type, atom):
+            raise OvsdbSchemaViolation("{}: {!r} is not a valid {}".format(
+                where, atom, self.type))
+        if self.enum is not None and atom not in self.enum:
+            raise OvsdbSchemaViolation("{}: {!r} is not one of {}".format(
+                where, atom, self.enum))
+        if (self.min is not None and atom < self.min) or \
+                (self.max is not None and atom > self.max):
+            raise OvsdbSchemaViolation("{}: {!r} is out of range".format(where, atom))
+        if (self.min_length is not None and len(atom) < self.min_length) or \
+                (self.max_length is not None and len(atom) > self.max_length):
+            raise OvsdbSchemaViolation("{}: {!r} has an invalid length".format(where, atom))
+
+    def parse(self, atom: str):
+        """
+        Converts an atom written as text (e.g. in the command line) to
+        this type. Strings may be quoted as in JSON.
+        :param atom: the text
+        :return: the atom, in its JSON representation
+        """
+        try:
+            if self.type == "integer":
+                return int(atom)
+            if self.type == "real":
+                return float(atom)
+        except ValueError:
+            raise OvsdbSchemaViolation("{!r} is not a valid {}".format(atom, self.type))
+        if self.type == "boolean":
+            if atom not in ["true", "false"]:
+                raise OvsdbSchemaViolation("{!r} is not a valid boolean".format(atom))
+            return atom == "true"
+        if self.type == "uuid":
+            return ["uuid", atom]
+        if len(atom) > 1 and atom[0] == atom[-1] == '"':
+            return json.loads(atom)
+        return atom
+
+
+class ColumnType:
+    """
+    Type of a column: an atom, a set of atoms or a map
+    """
+
+    def __init__(self, column_type, mutable: bool = True):
+        if not isinstance(column_type, dict):
+            column_type = {"key": column_type}
+        self.key = BaseType(column_type["key"])
+        self.value = BaseType(column_type["value"]) if "value" in column_type else None
+        self.min = column_type.get("min", 1)
+        self.max = column_type.get("max", 1)
+        self.mutable = mutable
+
+    @property
+    def is_map(self) -> bool:
+        return self.value is not None
+
+    @property
+    def is_set(self) -> bool:
+        return not self.is_map and (self.min != 1 or self.max != 1)
+
+    def default(self):
+        """
+        Gets the value of the column in a new row, if none is given
+        :return: the default value
+        """
+        if self.is_map:
+            return ["map", []]
+        if self.is_set:
+            return ["set", []]
+        return DEFAULT_ATOMS[self.key.type]
+
+    def validate(self, value, where: str):
+        """
+        Checks that a value belongs to this type
+        :param value: the value, in its JSON representation
+        :param where: description of the value, used in the error message
+        :return:
+        """
+        if self.is_map:
+            if not (isinstance(value, list) and len(value) == 2 and value[0] == "map"):
+                raise OvsdbSchemaViolation("{}: {!r} is not a map".format(where, value))
+            elements = value[1]
+            for key, val in elements:
+                self.key.validate(key, where)
+                self.value.validate(val, where)
+        else:
+            is_set = isinstance(value, list) and len(value) == 2 and value[0] == "set"
+            elements = value[1] if is_set else [value]
+            for element in elements:
+                self.key.validate(element, where)
+        if len(elements) < self.min or (self.max != "unlimited" and len(elements) > self.max):
+            raise OvsdbSchemaViolation("{}: {} elements, expected between {} and {}".format(
+                where, len(elements), self.min, self.max))
+
+    def parse(self, value: str):
+        """
+        Converts a value written as text to this type: "[]" for an empty
+        set or map, comma separated atoms for a set, or a single atom
+        :param value: the text
+        :return: the value, in its JSON representation
+        """
+        if value == "[]":
+            return self.default() if self.is_map or self.is_set else ["set", []]
+        if self.is_map:
+            raise OvsdbSchemaViolation("Maps have to be set key by key (COLUMN:KEY=VALUE)")
+        if self.is_set:
+            return ["set", [self.key.parse(atom) for atom in value.split(",")]]
+        return self.key.parse(value)
+
+
+class OvsdbSchema:
+    """
+    Schema of a database. It can check the operations built with the
+    operation module before they are sent to the server.
+    """
+
+    def __init__(self, schema: Dict):
+        self.raw = schema
+        self.name = schema["name"]
+        self.version = schema.get("version")
+        self.tables = {
+            table: {column: ColumnType(column_schema["type"],
+                                       column_schema.get("mutable", True))
+                    for column, column_schema in table_schema["columns"].items()}
+            for table, table_schema in schema["tables"].items()
+        }
+
+    def column_type(self, table: str, column: str) -> ColumnType:
+        """
+        Gets the type of a column
+        :param table: the table
+        :param column: the column
+        :return: ColumnType
+        """
+        columns = self._table(table)
+        if column == "_uuid":
+            return ColumnType("uuid")
+        if column not in columns:
+            raise OvsdbSchemaViolation("Table '{}' has no column '{}'".format(table, column))
+        return columns[column]
+
+    def validate(self, op: Dict):
+        """
+        Checks that an operation is valid for this schema
+        :param op: the operation
+        :return:
+        """
+        table = op.get("table")
+        if table is None:
+            return
+        self._table(table)
+        for column, _, _ in op.get("where", []):
+            if column != "_version":
+                self.column_type(table, column)
+        for column in op.get("columns", []):
+            if column not in SYSTEM_COLUMNS:
+                self.column_type(table, column)
+        if op["op"] in ["insert", "update"]:
+            self._validate_row(table, op["row"], op["op"] == "update")
+        elif op["op"] == "mutate":
+            for column, mutator, _ in op["mutations"]:
+                self._validate_mutator(table, column, mutator)
+
+    def _table(self, table: str) -> Dict:
+        if table not in self.tables:
+            raise OvsdbSchemaViolation("Database '{}' has no table '{}'".format(
+                self.name, table))
+        return self.tables[table]
+
+    def _validate_row(self, table: str, row: Dict, update: bool):
+        for column, value in row.items():
+            where = "{}.{}".format(table, column)
+            if column in SYSTEM_COLUMNS:
+                raise OvsdbSchemaViolation("{} cannot be written".format(where))
+            column_type = self.column_type(table, column)
+            if update and not column_type.mutable:
+                raise OvsdbSchemaViolation("{} is not mutable".format(where))
+            column_type.validate(value, where)
+
+    def _validate_mutator(self, table: str, column: str, mutator: str):
+        column_type = self.column_type(table, column)
+        if column_type.is_map or column_type.is_set:
+            allowed = ["insert", "delete"] + MUTATORS.get(column_type.key.type, [])
+        else:
+            allowed = MUTATORS.get(column_type.key.type, [])
+        if mutator not in allowed:
+            raise OvsdbSchemaViolation("Mutator '{}' cannot be used on {}.{}".format(
+                mutator, table, column))
+
+
+def parse_schema(schema: Dict) -> OvsdbSchema:
+    """
+    Parses a schema returned by the server. Schemas are cached by name
+    and version, so they are only parsed once per process.
+    :param schema: the schema, as returned by get_schema
+    :return: OvsdbSchema
+    """
+    key = (schema["name"], schema.get("version"), schema.get("cksum"))
+    with _CACHE_LOCK:
+        if key not in _CACHE:
+            _CACHE[key] = OvsdbSchema(schema)
+        return _CACHE[key]
+
+
+def validate_ops(schema: OvsdbSchema, ops: List[Dict]):
+    """
+    Checks a list of operations
+    :param schema: the schema of the database
+    :param ops: the operations
+    :return:
+    """
+    for op in ops:
+        schema.validate(op)
+
+
+def _is_atom(atom_type: str, atom) -> bool:
+    if atom_type == "integer":
+        return isinstance(atom, int) and not isinstance(atom, bool)
+    if atom_type == "real":
+        return isinstance(atom, (int, float)) and not isinstance(atom, bool)
+    if atom_type == "boolean":
+        return isinstance(atom, bool)
+    if atom_type == "string":
+        return isinstance(atom, str)
+    return isinstance(atom, list) and len(atom) == 2 and atom[0] in ["uuid", "named-uuid"]
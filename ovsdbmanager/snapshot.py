@@ -0,0 +1,107 @@
+"""
+Helper module to save the content of some tables to a local file and load
+it back, so that a client can resume monitoring the database from the
+last transaction it saw instead of reading the whole tables again.
+
+The file is laid out as follows (integers are big endian):
+
+    MAGIC | header length (u32) | header (JSON) |
+    table length (u64) | table rows (JSON) | ...
+
+The header holds the database name, the id of the last transaction and
+the name of the tables, in the same order as the table blocks. Tables
+that are not needed can be skipped without decoding them.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List, Tuple
+
+MAGIC = b"OVSDBSN1"
+HEADER_LEN = struct.Struct(">I")
+TABLE_LEN = struct.Struct(">Q")
+
+
+def save_snapshot(path: str, db: str, last_txn_id: str, tables: Dict[str, Dict],
+                  columns: Dict[str, List] = None):
+    """
+    Saves the content of the tables to a file. The file is replaced
+    atomically, so a crash while saving never leaves a corrupt snapshot.
+    :param path: the path of the file
+    :param db: the database the tables belong to
+    :param last_txn_id: the id of the last transaction applied to 'tables'
+    :param tables: the rows of each table, keyed by table name and uuid
+    :param columns: the columns stored for each table (None for all of
+    them). If not present, all the columns of all the tables
+    :return:
+    """
+    names = list(tables)
+    columns = columns or {}
+    header = _dumps({"db": db, "last_txn_id": last_txn_id, "tables": names,
+                     "columns": {name: columns.get(name) for name in names}})
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for name in names:
+            rows = _dumps(tables[name])
+            f.write(TABLE_LEN.pack(len(rows)))
+            f.write(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str, tables: List[str] = None) -> Tuple[str, str, Dict, Dict[str, Dict]]:
+    """
+    Loads a snapshot saved with save_snapshot
+    :param path: the path of the file
+    :param tables: the tables to load. If not present all are loaded
+    :return: the database, the id of the last transaction, the columns
+    stored for each table (None if the snapshot does not record them) and
+    the rows of each table, keyed by table name and uuid
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a snapshot file".format(path))
+        offset = len(MAGIC)
+        header_len, = HEADER_LEN.unpack_from(data, offset)
+        offset += HEADER_LEN.size
+        header = json.loads(data[offset:offset + header_len].decode())
+        offset += header_len
+
+        rows = {}
+        for name in header["tables"]:
+            table_len, = TABLE_LEN.unpack_from(data, offset)
+            offset += TABLE_LEN.size
+            if tables is None or name in tables:
+                rows[name] = json.loads(data[offset:offset + table_len].decode())
+            offset += table_len
+    columns = header.get("columns")
+    if columns is not None:
+        columns = {name: columns[name] for name in rows}
+    return header["db"], header["last_txn_id"], columns, rows
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode()
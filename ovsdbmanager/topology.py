@@ -0,0 +1,150 @@
+"""
+Topology - Description of a set of bridges connected by patch ports,
+which is created in a single transaction.
+
+     Copyright (C) 2020  Fundació Privada I2CAT, Internet i Innovació digital a Catalunya
+
+     This program is free software: you can redistribute it and/or modify
+     it under the terms of the GNU Affero General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     This program is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU Affero General Public License for more details.
+
+     You should have received a copy of the GNU Affero General Public License
+     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+     Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
+"""
+
+from typing import Dict, List, Tuple
+
+from ovsdbmanager import operation
+from ovsdbmanager.condition import get_by_name, get_by_uuid
+from ovsdbmanager.exception import OvsdbQueryException
+from ovsdbmanager.utils import generate_uuid, named_uuid
+
+
+class Topology:
+    """
+    A graph of bridges whose edges are patch links. Each link is a pair
+    of patch ports, one on each bridge, that point to each other.
+    """
+
+    def __init__(self, bridges: List[str] = None, links: List[Tuple] = None):
+        """
+        :param bridges: names of the bridges
+        :param links: links between bridges, as tuples of the arguments
+        of add_link
+        """
+        self.bridges = []
+        self.links = []
+        for bridge in bridges or []:
+            self.add_bridge(bridge)
+        for link in links or []:
+            self.add_link(*link)
+
+    def add_bridge(self, name: str) -> "Topology":
+        """
+        Adds a bridge
+        :param name: the name of the bridge
+        :return: the topology
+        """
+        if name not in self.bridges:
+            self.bridges.append(name)
+        return self
+
+    def add_link(self, bridge_a: str, bridge_b: str, port_a: str = None,
+                 port_b: str = None) -> "Topology":
+        """
+        Connects two bridges with a pair of patch ports. The bridges are
+        added to the topology if needed.
+        :param bridge_a: name of the first bridge
+        :param bridge_b: name of the second bridge
+        :param port_a: name of the patch port of the first bridge. By
+        default, "<bridge_a>-to-<bridge_b>"
+        :param port_b: name of the patch port of the second bridge. By
+        default, "<bridge_b>-to-<bridge_a>"
+        :return: the topology
+        """
+        if bridge_a == bridge_b:
+            raise OvsdbQueryException("Cannot link bridge '{}' with itself".format(bridge_a))
+        self.add_bridge(bridge_a)
+        self.add_bridge(bridge_b)
+        self.links.append((bridge_a, bridge_b,
+                           port_a or "{}-to-{}".format(bridge_a, bridge_b),
+                           port_b or "{}-to-{}".format(bridge_b, bridge_a)))
+        return self
+
+    def build_ops(self, existing: Dict[str, List] = None) -> List[Dict]:
+        """
+        Builds the operations that create the topology. All the rows are
+        referenced by named uuids, so nothing has to be read before.
+        :param existing: uuids of the bridges that already exist, by name.
+        Only their patch ports are added, and the transaction fails if
+        they are deleted in the meantime. The rest of the bridges are
+        created, and the transaction fails if they are created in the
+        meantime.
+        :return: the list of operations
+        """
+        existing = existing or {}
+        self._check_names(existing)
+        ops = []
+        ports = {bridge: [] for bridge in self.bridges}
+        for bridge_a, bridge_b, port_a, port_b in self.links:
+            ports[bridge_a].append(_add_port(ops, port_a, {
+                "type": "patch", "options": ["map", [["peer", port_b]]]}))
+            ports[bridge_b].append(_add_port(ops, port_b, {
+                "type": "patch", "options": ["map", [["peer", port_a]]]}))
+
+        new_bridges = []
+        for bridge in self.bridges:
+            if bridge in existing:
+                ops.append(operation.wait("Bridge",
+                                          where=[get_by_uuid(existing[bridge])],
+                                          columns=["name"],
+                                          rows=[{"name": bridge}]))
+                if ports[bridge]:
+                    ops.append(operation.mutate("Bridge",
+                                                [["ports", "insert", ["set", ports[bridge]]]],
+                                                where=[get_by_uuid(existing[bridge])]))
+                continue
+            bridge_id = generate_uuid()
+            local_port = _add_port(ops, bridge, {"type": "internal"})
+            ops.append(operation.wait("Bridge",
+                                      where=[get_by_name(bridge)],
+                                      columns=["name"],
+                                      rows=[]))
+            ops.append(operation.insert("Bridge",
+                                        row={"name": bridge,
+                                             "ports": ["set", [local_port] + ports[bridge]]},
+                                        uuid_name=bridge_id))
+            new_bridges.append(named_uuid(bridge_id))
+
+        if new_bridges:
+            ops.append(operation.mutate("Open_vSwitch",
+                                        [["bridges", "insert", ["set", new_bridges]]]))
+        return ops
+
+    def _check_names(self, existing: Dict[str, List]):
+        names = [bridge for bridge in self.bridges if bridge not in existing]
+        for _, _, port_a, port_b in self.links:
+            names += [port_a, port_b]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise OvsdbQueryException("Duplicated port names: {}".format(", ".join(duplicated)))
+
+
+def _add_port(ops: List[Dict], name: str, interface: Dict) -> List:
+    interface_id, port_id = [generate_uuid() for _ in range(2)]
+    ops.append(operation.insert("Interface",
+                                row=dict(interface, name=name),
+                                uuid_name=interface_id))
+    ops.append(operation.insert("Port",
+                                row={"name": name,
+                                     "interfaces": named_uuid(interface_id)},
+                                uuid_name=port_id))
+    return named_uuid(port_id)
@@ -19,6 +19,7 @@ Helper module for handling UUIDs
      Authors: Ferran Cañellas <ferran.canellas@i2cat.net>
 """
 
+import random
 from typing import List, Dict
 from uuid import uuid4
 
@@ -40,9 +41,50 @@ def named_uuid(uuid: str) -> List:
     return ["named-uuid", uuid]
 
 
+def jittered_backoff(attempt: int, base: float, maximum: float) -> float:
+    """
+    Computes the time to wait before retrying a request ("full jitter"
+    exponential backoff)
+    :param attempt: number of attempts already failed, starting at 0
+    :param base: the maximum delay of the first retry
+    :param maximum: the maximum delay of any retry
+    :return: the number of seconds to wait
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+def parse_set(set_: List) -> List:
+    """
+    Converts an OVSDB set into a list of elements. Sets of exactly one
+    element are sent by the server as the bare element.
+    :param set_: the OVSDB set
+    :return: the list of elements
+    """
+    if isinstance(set_, list) and set_ and set_[0] == "set":
+        return set_[1]
+    return [set_]
+
+
 def parse_map(map_: List) -> Dict:
     return {elem[0]: elem[1] for elem in map_}
 
 
 def add_to_map(map_: List, key: str, value: str) -> List:
-    return map_[1].append([key, value])
+    """
+    Sets a key of an OVSDB map
+    :param map_: the OVSDB map, which is not modified
+    :param key: the key
+    :param value: the value
+    :return: a new map with the key set to the value
+    """
+    return ["map", [pair for pair in map_[1] if pair[0] != key] + [[key, value]]]
+
+
+def del_from_map(map_: List, key: str) -> List:
+    """
+    Deletes a key of an OVSDB map
+    :param map_: the OVSDB map, which is not modified
+    :param key: the key
+    :return: a new map without the key
+    """
+    return ["map", [pair for pair in map_[1] if pair[0] != key]]
@@ -34,6 +34,12 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/Fundacio-i2CAT/ovsdb-manager",
     packages=find_packages(),
+    entry_points={
+        "console_scripts": [
+            "ovsdb-batch=ovsdbmanager.cli:main",
+            "ovsdb-replay=ovsdbmanager.replay:main",
+        ],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)",